@@ -0,0 +1,169 @@
+import math
+import time
+import numpy as np
+import torch
+
+from . import checkpoint, sched, torch_util
+
+
+def tune(mgr, make_batch, batch_sz, sizes=None, max_memory=None, lr_scaling='linear', **kwargs):
+    """Pick the batch size with the best throughput under max_memory bytes.
+
+    Probes the manager with each of the sizes, by default from a quarter up
+    to 16 times batch_sz, see probe. The manager's schedule is then rescaled
+    from batch_sz to the chosen size, see rescale, but the loaders need to be
+    rebuilt for it by the caller. Returns the chosen size and the probe results.
+    """
+
+    if sizes is None:
+        sizes = sorted({max(1, batch_sz * 2**k // 4) for k in range(7)})
+    results = probe(mgr, make_batch, sizes, max_memory=max_memory, **kwargs)
+    best = choose(results, max_memory)
+    rescale(mgr.schedule, batch_sz, best, lr_scaling)
+    return best, results
+
+
+def probe(mgr, make_batch, sizes, n_steps=3, warmup=1, max_memory=None):
+    """Time training steps at increasing batch sizes, and measure peak memory.
+
+    Batches come from make_batch, which takes a size and returns a batch just
+    like those from a loader, e.g. from sampler. Probing stops at the first
+    size which runs out of memory or goes over max_memory bytes, or which is
+    expected to do so from the memory used by the previous one.
+
+    The schedule does not advance, and nothing about the manager changes, see
+    checkpoint.rollback. Returns a row per size.
+    """
+
+    if n_steps < 1:
+        raise ValueError(f'n_steps must be at least 1, was {n_steps}')
+    results = []
+    with checkpoint.rollback(mgr, sched.nop()):
+        baseline = _current_memory()
+        for batch_sz in sorted(sizes):
+            if results and _expect_over(results[-1], batch_sz, baseline, max_memory):
+                break
+            try:
+                row = _probe(mgr, make_batch(batch_sz), n_steps, warmup)
+            except (RuntimeError, MemoryError) as e:
+                if not _out_of_memory(e):
+                    raise
+                break
+            results.append(dict(batch_sz=batch_sz, **row))
+            if _over(row, max_memory):
+                break
+    return results
+
+
+def choose(results, max_memory=None):
+    """The batch size with the most samples/sec in results, under max_memory."""
+
+    fits = [row for row in results if not _over(row, max_memory)]
+    if not fits:
+        raise ValueError(f'no probed batch size fits in {max_memory} bytes')
+    return max(fits, key=lambda row: row['samples_per_sec'])['batch_sz']
+
+
+def rescale(schedule, old_batch_sz, new_batch_sz, lr_scaling='linear'):
+    """Adjust a schedule for training on the same data with a new batch size.
+
+    The number of steps scales inversely with the batch size, and the base
+    lrs scale with it, either 'linear'ly, by its 'sqrt', or not at all for 'none'.
+    """
+
+    if lr_scaling not in _LR_SCALINGS:
+        raise ValueError(f'lr_scaling must be one of {list(_LR_SCALINGS)}, was {lr_scaling}')
+    ratio = new_batch_sz / old_batch_sz
+    schedule.nb = math.ceil(schedule.nb / ratio)
+    if schedule.init_lrs is not None:
+        schedule.init_lrs = schedule.init_lrs * _LR_SCALINGS[lr_scaling](ratio)
+    return schedule
+
+
+_LR_SCALINGS = {
+    'linear': lambda ratio: ratio,
+    'sqrt': math.sqrt,
+    'none': lambda ratio: 1,
+}
+
+
+def sampler(*arrays, seed=None):
+    """A make_batch function drawing random rows of arrays, i.e. xs and then y."""
+
+    rng = np.random.RandomState(seed)
+    n = len(arrays[0])
+
+    def make_batch(batch_sz):
+        idxs = rng.randint(n, size=batch_sz)
+        return tuple(array[idxs] for array in arrays)
+
+    return make_batch
+
+
+def _probe(mgr, batch, n_steps, warmup):
+    xs, y = torch_util.variable_batch(batch)
+    _reset_peak_memory()
+    for _ in range(warmup):
+        torch_util.materialize(mgr.step(xs, y, with_step=True)[0])
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        loss, _ = mgr.step(xs, y, with_step=True)
+    torch_util.materialize(loss)
+    secs = time.perf_counter() - start
+    samples = n_steps * torch_util.batch_size(xs, mgr.seq_first)
+    return {'samples_per_sec': samples / secs, 'peak_memory': _peak_memory()}
+
+
+def _out_of_memory(e):
+    if isinstance(e, MemoryError) or isinstance(e, getattr(torch, 'OutOfMemoryError', ())):
+        return True
+    message = str(e)
+    return 'out of memory' in message or "can't allocate memory" in message
+
+
+def _expect_over(row, batch_sz, baseline, max_memory):
+    """Whether batch_sz should go over max_memory, extrapolating from row."""
+    if max_memory is None or row['peak_memory'] is None or baseline is None:
+        return False
+    expected = baseline + (row['peak_memory'] - baseline) * batch_sz / row['batch_sz']
+    return expected > max_memory
+
+
+def _over(row, max_memory):
+    peak = row['peak_memory']
+    return max_memory is not None and peak is not None and peak > max_memory
+
+
+def _reset_peak_memory():
+    if torch_util.USE_GPU:
+        torch.cuda.reset_peak_memory_stats()
+        return
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_memory():
+    if torch_util.USE_GPU:
+        return torch.cuda.max_memory_allocated()
+    return _proc_status('VmHWM')
+
+
+def _current_memory():
+    if torch_util.USE_GPU:
+        return torch.cuda.memory_allocated()
+    return _proc_status('VmRSS')
+
+
+def _proc_status(key):
+    """A memory size in bytes from /proc/self/status, or None without procfs."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
@@ -1,6 +1,8 @@
+import contextlib
+import weakref
 import torch
 
-from . import sched, util
+from . import metrics, sched, timing, torch_util, util
 
 
 class Manager():
@@ -14,72 +16,361 @@ class Manager():
     If requested, typically during evaluation, we also compute some
     additional metrics over the batch.
 
+    Losses are copied back to the host every sync_every batches. In between,
+    they are accumulated as tensors on the device to avoid a stall per batch.
+
+    To train with larger effective batches, gradients can be accumulated over
+    several consecutive batches, and each batch can be split along the batch
+    dimension into micro_batches. Either way, the optimizer and scheduler only
+    step once per logical batch, and gradients are weighted by sample counts.
+    Splitting is only suitable for models without state across batches.
+    With seq_first, targets and predictions are either (seq_len, batch_sz, ...)
+    or flattened to (seq_len*batch_sz, ...), as is usual for language models.
+
+    The forward pass and loss can run in reduced precision, either 'bf16' or
+    'fp16'. The latter uses a loss scaler, and on overflow both the optimizer
+    and the scheduler skip the step.
+
+    To see where the time goes, pass a timing.PhaseTimer as the timer.
+
+    If compile is set, the forward pass and loss are compiled together with
+    torch.compile, using compile as its keyword arguments if it is a dict.
+    The batch dimension is marked as dynamic, so that short final batches do
+    not trigger a recompile. Without torch.compile, this is a no-op.
+
     See loop.fit for usage.
     """
 
-    def __init__(self, model, optim, loss, schedule=None, metrics=None, seq_first=False):
+    def __init__(
+        self,
+        model,
+        optim,
+        loss,
+        schedule=None,
+        metrics=None,
+        seq_first=False,
+        sync_every=1,
+        accumulate=1,
+        micro_batches=1,
+        precision=None,
+        timer=None,
+        compile=False,
+    ):
+        if sync_every < 1:
+            raise ValueError(f'sync_every must be at least 1, was {sync_every}')
+        if accumulate < 1:
+            raise ValueError(f'accumulate must be at least 1, was {accumulate}')
+        if micro_batches < 1:
+            raise ValueError(f'micro_batches must be at least 1, was {micro_batches}')
+        if precision not in _PRECISIONS:
+            raise ValueError(f'precision must be one of {list(_PRECISIONS)}, was {precision}')
         self.model = model
         self.optim = optim
         self.loss = loss
         self.schedule = schedule or sched.nop()
         self.metrics = metrics or []
         self.seq_first = seq_first
-
-    def init_training(self):
-        self.schedule.init_training()
+        self.sync_every = sync_every
+        self.accumulate = accumulate
+        self.micro_batches = micro_batches
+        self.precision = precision
+        self.scaler = torch_util.grad_scaler() if precision == 'fp16' else None
+        self.timer = timer or timing.NO_TIMER
+        self.compile = compile
+        self._compiled = None
+        self._mode_plan = None
+        self._weighted = accumulate > 1 or micro_batches > 1
+        self._pending_batches = 0
+        self._pending_samples = 0
+        # Combines averages across processes, see distributed.prepare.
+        self.reduce = None
+
+    def init_training(self, start=0):
+        self._pending_batches = 0
+        self._pending_samples = 0
+        self.schedule.init_training(start)
 
     def step(self, xs, y, with_step=False):
-        preds = self.model(*xs)
-        loss = self.loss(preds, y)
+        if self.micro_batches > 1:
+            loss, preds = self._split_step(xs, y, with_step)
+        else:
+            preds, loss = self._forward(xs, y)
+            if with_step:
+                self._backward(loss, torch_util.batch_size(xs, self.seq_first))
         if with_step:
+            self._pending_batches += 1
+            if self._pending_batches == self.accumulate:
+                self._optim_step()
+        if self.sync_every > 1:
+            return loss.detach(), preds
+        return _item(loss.data), preds
+
+    @property
+    def accumulating(self):
+        """Whether the gradients of some batches still await an optimizer step."""
+        return self._pending_batches > 0
+
+    def flush(self):
+        """Take an optimizer step for any partially accumulated batch."""
+        if self._pending_batches:
+            self._optim_step()
+
+    def _split_step(self, xs, y, with_step):
+        dim = 1 if self.seq_first else 0
+        seq_len = xs[0].shape[0]
+        batch_sz = torch_util.batch_size(xs, self.seq_first)
+        x_chunks = zip(*[x.chunk(self.micro_batches, dim) for x in xs])
+        y_chunks = _chunk_targets(y, self.micro_batches, self.seq_first, seq_len, batch_sz)
+        losses, preds, chunk_szs = [], [], []
+        for chunk_xs, chunk_y in zip(x_chunks, y_chunks):
+            chunk_preds, chunk_loss = self._forward(chunk_xs, chunk_y)
+            chunk_sz = torch_util.batch_size(chunk_xs, self.seq_first)
+            if with_step:
+                self._backward(chunk_loss, chunk_sz)
+            losses.append(chunk_loss.detach() * chunk_sz)
+            preds.append(chunk_preds.detach() if torch.is_tensor(chunk_preds) else chunk_preds)
+            chunk_szs.append(chunk_sz)
+        loss = sum(losses) / batch_sz
+        if not torch.is_tensor(preds[0]):
+            return loss, preds
+        return loss, _cat_preds(preds, self.seq_first, seq_len, chunk_szs)
+
+    def _forward(self, xs, y):
+        if self.compile:
+            return self._compiled_forward(xs, y)
+        with torch_util.autocast(_PRECISIONS[self.precision]):
+            with self.timer.phase('forward'):
+                preds = self.model(*xs)
+            with self.timer.phase('loss'):
+                return preds, self.loss(preds, y)
+
+    def _compiled_forward(self, xs, y):
+        if self._compiled is None:
+            kwargs = self.compile if isinstance(self.compile, dict) else {}
+            self._compiled = torch_util.compile(self._forward_loss, **kwargs)
+        dim = 1 if self.seq_first else 0
+        for x in list(xs) + [y]:
+            torch_util.mark_dynamic(x, dim)
+        with torch_util.autocast(_PRECISIONS[self.precision]):
+            with self.timer.phase('forward'):
+                return self._compiled(xs, y)
+
+    def _forward_loss(self, xs, y):
+        preds = self.model(*xs)
+        return preds, self.loss(preds, y)
+
+    def _backward(self, loss, batch_sz):
+        if not self._pending_samples:
             self.optim.zero_grad()
+        if self._weighted:
+            loss = loss * batch_sz
+        if self.scaler is not None:
+            loss = self.scaler.scale(loss)
+        with self.timer.phase('backward'):
             loss.backward()
+        self._pending_samples += batch_sz
+
+    def _optim_step(self):
+        with self.timer.phase('optim'):
+            stepped = self._optim_update()
+        if stepped:
+            with self.timer.phase('schedule'):
+                self.schedule.step()
+        self._pending_batches = 0
+        self._pending_samples = 0
+
+    def _optim_update(self):
+        if self._weighted:
+            self.optim.scale_grads(1 / self._pending_samples)
+        if self.scaler is None:
             self.optim.step()
-            self.schedule.step()
-        return _item(loss.data), preds
+            return True
+        scale = self.scaler.get_scale()
+        self.scaler.step(self.optim)
+        self.scaler.update()
+        return self.scaler.get_scale() >= scale
+
+    def predict(self, xs):
+        """Predictions for a batch of inputs, see loop.predict for usage."""
+        with torch_util.autocast(_PRECISIONS[self.precision]):
+            with self.timer.phase('forward'):
+                return self.model(*xs)
 
     def train_runner(self):
-        _set_train(self.model)
+        self.train_mode()
         return self._make_runner(True, False)
 
-    def eval_runner(self):
-        self.model.eval()
+    def eval_runner(self, reset=True):
+        self.eval_mode(reset)
         return self._make_runner(False, True)
 
+    def train_mode(self, reset=True):
+        """Put the model in train mode, except for frozen layers, resetting any state if reset."""
+        self._modes().train()
+        if reset:
+            self._reset_model()
+
+    def eval_mode(self, reset=True):
+        """Put the model in eval mode, resetting any state if reset."""
+        self._modes().eval()
+        if reset:
+            self._reset_model()
+
+    @contextlib.contextmanager
+    def keep_state(self):
+        """Put back any state the model keeps between batches after the block.
+
+        The attributes of every module, e.g. the hidden state of an RNN, are
+        restored as they were on entry, except for the train or eval modes.
+        Tensors are not copied, so the state should be replaced rather than
+        changed in place, as is usual.
+        """
+        saved = [
+            (module, {k: v for k, v in vars(module).items() if k != 'training'})
+            for module in _all_modules(_unwrap(self.model))
+        ]
+        try:
+            yield
+        finally:
+            for module, attrs in saved:
+                vars(module).update(attrs)
+
+    def _modes(self):
+        if self._mode_plan is None or self._mode_plan.model is not self.model:
+            self._mode_plan = _ModePlan(self.model)
+        return self._mode_plan
+
+    def _reset_model(self):
+        model = _unwrap(self.model)
+        if hasattr(model, 'reset'):
+            model.reset()
+
     def _make_runner(self, with_step=False, with_metrics=False, ema_window=50):
-        if hasattr(self.model, 'reset'):
-            self.model.reset()
         metric_fns = self.metrics if with_metrics else []
-        return TrackedRunner(self, with_step, metric_fns, ema_window)
+        return TrackedRunner(
+            self, with_step, metric_fns, ema_window, self.sync_every, self.reduce, self.timer)
+
+
+def _unwrap(model):
+    if isinstance(model, torch.nn.parallel.DistributedDataParallel):
+        return model.module
+    return model
+
+
+_PRECISIONS = {None: None, 'bf16': torch.bfloat16, 'fp16': torch.float16}
 
 
 def _item(x):
     return x.item() if hasattr(x, 'item') else x[0]
 
 
+def _seq_first_flat(x, seq_len, batch_sz):
+    """Whether x is seq-first, but flattened over its first two axes."""
+    if x.dim() >= 2 and x.shape[0] == seq_len and x.shape[1] == batch_sz:
+        return False
+    return x.dim() >= 1 and x.shape[0] == seq_len * batch_sz
+
+
+def _chunk_targets(y, n, seq_first, seq_len, batch_sz):
+    if not seq_first:
+        return y.chunk(n, 0)
+    rest = y.shape[1:]
+    if _seq_first_flat(y, seq_len, batch_sz):
+        chunks = y.reshape(seq_len, batch_sz, *rest).chunk(n, 1)
+        return [chunk.reshape(-1, *rest) for chunk in chunks]
+    if y.dim() < 2 or y.shape[1] != batch_sz:
+        raise ValueError(
+            f'seq_first targets must be ({seq_len}, {batch_sz}, ...) or flattened '
+            f'to ({seq_len * batch_sz}, ...), was {tuple(y.shape)}')
+    return y.chunk(n, 1)
+
+
+def _cat_preds(preds, seq_first, seq_len, chunk_szs):
+    if not seq_first:
+        return torch.cat(preds, 0)
+    if not all(_seq_first_flat(p, seq_len, sz) for p, sz in zip(preds, chunk_szs)):
+        return torch.cat(preds, 1)
+    rest = preds[0].shape[1:]
+    unflat = [p.reshape(seq_len, sz, *rest) for p, sz in zip(preds, chunk_szs)]
+    return torch.cat(unflat, 1).reshape(-1, *rest)
+
+
 class TrackedRunner(object):
-    """Track average loss and metrics across the lifetime of a runner."""
+    """Track average loss and metrics across the lifetime of a runner.
+
+    Averages may be accumulated as device tensors, which are only copied
+    back to the host by report, or by run once every sync_every batches.
+    On the other batches, run returns None instead of the running loss.
 
-    def __init__(self, mgr, with_step, metric_fns, ema_window=50):
+    Metrics are either functions of predictions and targets, which are
+    averaged across batches, or instances of metrics.StreamingMetric.
+
+    If given, reduce maps the averages to global values when reporting.
+    """
+
+    def __init__(
+        self, mgr, with_step, metric_fns,
+        ema_window=50, sync_every=1, reduce=None, timer=None,
+    ):
         self.mgr = mgr
         self.with_step = with_step
         self.metric_fns = metric_fns
+        self.sync_every = sync_every
+        self.reduce = reduce
+        self.timer = timer or timing.NO_TIMER
+        self.n_batches = 0
         self.avg_loss = WeightedAverage()
-        self.avg_metrics = [WeightedAverage() for _ in metric_fns]
+        self.avg_metrics = [
+            fn.fresh() if isinstance(fn, metrics.StreamingMetric) else WeightedAverage()
+            for fn in metric_fns
+        ]
         self.running_loss = ExponentialMovingAverage(ema_window)
 
     def run(self, xs, y):
         loss, preds = self.mgr.step(xs, y, self.with_step)
-        metrics = [fn(preds.data, y.data) for fn in self.metric_fns]
-        x0 = xs[0] if util.is_listy(xs) else xs
-        batch_sz = x0.shape[1 if self.mgr.seq_first else 0]
+        batch_sz = torch_util.batch_size(xs, self.mgr.seq_first)
+        with self.timer.phase('metrics'):
+            for fn, average in zip(self.metric_fns, self.avg_metrics):
+                if isinstance(average, metrics.StreamingMetric):
+                    average.update(preds.data, y.data)
+                else:
+                    average.update(fn(preds.data, y.data), wt=batch_sz)
         self.avg_loss.update(loss, wt=batch_sz)
-        for average, metric in zip(self.avg_metrics, metrics):
-            average.update(metric, wt=batch_sz)
-        return self.running_loss.update(loss)
+        running_loss = self.running_loss.update(loss)
+        self.n_batches += 1
+        if self.n_batches % self.sync_every == 0:
+            return torch_util.materialize(running_loss)
+
+    def running_value(self):
+        """The running loss, copied back to the host if need be."""
+        return torch_util.materialize(self.running_loss.value())
+
+    def flush(self):
+        if self.with_step:
+            self.mgr.flush()
+
+    def state_dict(self):
+        return {
+            'n_batches': self.n_batches,
+            'avg_loss': self.avg_loss.state_dict(),
+            'avg_metrics': [average.state_dict() for average in self.avg_metrics],
+            'running_loss': self.running_loss.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.n_batches = state['n_batches']
+        self.avg_loss.load_state_dict(state['avg_loss'])
+        for average, average_state in zip(self.avg_metrics, state['avg_metrics']):
+            average.load_state_dict(average_state)
+        self.running_loss.load_state_dict(state['running_loss'])
 
     def report(self):
-        return self.avg_loss.value(), [metric.value() for metric in self.avg_metrics]
+        averages = [self.avg_loss] + self.avg_metrics
+        if self.reduce is None:
+            values = [torch_util.materialize(average.value()) for average in averages]
+        else:
+            values = self.reduce(averages)
+        return values[0], values[1:]
 
 
 class ExponentialMovingAverage(object):
@@ -101,6 +392,13 @@ class ExponentialMovingAverage(object):
     def value(self):
         return self.average / self.debias
 
+    def state_dict(self):
+        return {'average': torch_util.materialize(self.average), 'debias': self.debias}
+
+    def load_state_dict(self, state):
+        self.average = state['average']
+        self.debias = state['debias']
+
 
 class WeightedAverage(object):
     """Stateful encapsulation of a weighted average."""
@@ -119,21 +417,125 @@ class WeightedAverage(object):
     def value(self):
         return self.numer / self.denom
 
+    def state_dict(self):
+        return {'numer': torch_util.materialize(self.numer), 'denom': self.denom}
+
+    def load_state_dict(self, state):
+        self.numer = state['numer']
+        self.denom = state['denom']
+
+
+class _ModePlan(object):
+    """A flat, cached plan for switching every module of a model between modes.
+
+    Walking the model and working out which modules can be frozen happens
+    once, and again only after modules are registered, see _RegistrationWatch.
+    The freeze flags themselves are read on every switch, since they are
+    cheap to check.
+
+    Modules which override train, e.g. to keep their norm layers in eval
+    mode, have it called as well, outermost first. Frozen layers are then
+    put in eval mode, but none are put back in train mode.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.stale = True
+        if _CACHE_MODES:
+            _registrations.watch(self)
+
+    def train(self):
+        self._switch(True)
+        for module, kind in self.freezable:
+            if _is_frozen_as(module, kind):
+                module.training = False
+
+    def eval(self):
+        self._switch(False)
+
+    def _switch(self, mode):
+        self._refresh()
+        # Skips the slow Module.__setattr__, which has nothing to do for a flag.
+        for attrs in self.attrs:
+            attrs['training'] = mode
+        for module in self.overrides:
+            module.train(mode)
+
+    def _refresh(self):
+        if not self.stale:
+            return
+        self.stale = not _CACHE_MODES
+        modules = _all_modules(self.model)
+        self.attrs = [vars(module) for module in modules]
+        self.overrides = [module for module in modules if type(module).train not in _PLAIN_TRAINS]
+        kinds = ((module, _freeze_kind(module)) for module in modules)
+        self.freezable = [(module, kind) for module, kind in kinds if kind is not None]
+
+
+_PLAIN_TRAINS = (torch.nn.Module.train, torch.nn.parallel.DistributedDataParallel.train)
+_CACHE_MODES = hasattr(torch.nn.modules.module, 'register_module_module_registration_hook')
+
+
+class _RegistrationWatch(object):
+    """Mark the plans stale whenever a module is registered anywhere.
+
+    The torch hook for that is only installed while there are any plans to
+    watch, i.e. while any Manager lives.
+    """
+
+    def __init__(self):
+        self.plans = weakref.WeakSet()
+        self.n_plans = 0
+        self.handle = None
+
+    def watch(self, plan):
+        self.plans.add(plan)
+        self.n_plans += 1
+        weakref.finalize(plan, self._unwatch)
+        if self.handle is None:
+            hook = torch.nn.modules.module.register_module_module_registration_hook
+            self.handle = hook(self._registered)
+
+    def _unwatch(self):
+        self.n_plans -= 1
+        if self.n_plans == 0 and self.handle is not None:
+            self.handle.remove()
+            self.handle = None
+
+    def _registered(self, module, name, submodule):
+        for plan in self.plans:
+            plan.stale = True
+
+
+_registrations = _RegistrationWatch()
+
+
+def _all_modules(model):
+    if util.is_listy(model):
+        modules = (module for child in model for module in _all_modules(child))
+        return list(dict.fromkeys(modules))
+    return list(model.modules())
+
 
 def _set_train(model):
-    children = model if util.is_listy(model) else list(model.children())
-    for child in children:
-        _set_train(child)
-    if isinstance(model, torch.nn.Module):
-        if _is_frozen(model):
-            model.eval()
-        else:
-            model.train()
+    _ModePlan(model).train()
 
 
-def _is_frozen(model):
+def _freeze_kind(model):
     if hasattr(model, 'p') and 'drop' in type(model).__name__.lower():
-        return getattr(model, 'drop_freeze', False)
+        return 'drop'
     if hasattr(model, 'running_mean'):
+        return 'bn'
+    return None
+
+
+def _is_frozen_as(model, kind):
+    if kind == 'drop':
+        return getattr(model, 'drop_freeze', False)
+    if kind == 'bn':
         return getattr(model, 'bn_freeze', False) or not getattr(model, 'trainable', False)
     return False
+
+
+def _is_frozen(model):
+    return _is_frozen_as(model, _freeze_kind(model))
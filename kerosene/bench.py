@@ -0,0 +1,147 @@
+"""Benchmarks for the overhead kerosene adds to the training hot path.
+
+Run with python -m kerosene.bench, which prints the results as JSON.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+import torch
+
+from . import batches, loop, optimizer, sched, torch_util
+
+
+class TinyModel(torch.nn.Module):
+    """A model with many tiny layers, so that the framework dominates."""
+
+    def __init__(self, n_layers):
+        super().__init__()
+        self.layers = torch.nn.ModuleList([torch.nn.Linear(4, 4) for _ in range(n_layers)])
+
+    def forward(self, x):
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+
+def make_manager(n_groups, n_layers, compiled=False, **kwargs):
+    """A manager over a tiny model split into n_groups, with a one_cycle schedule."""
+
+    model = TinyModel(n_groups * n_layers)
+    layer_groups = [
+        list(model.layers[i*n_layers:(i+1)*n_layers])
+        for i in range(n_groups)
+    ]
+    optim = optimizer.make(torch.optim.SGD, layer_groups, 1e-3, wds=1e-4)
+    schedule = sched.one_cycle(optim, 1 << 16, compiled=compiled)
+    return batches.Manager(model, optim, torch.nn.functional.mse_loss, schedule, **kwargs)
+
+
+def bench_step(n_groups, n_layers, n_steps, batch_sz=8, **kwargs):
+    """Seconds per training step, for a given number of groups and layers."""
+
+    mgr = make_manager(n_groups, n_layers, **kwargs)
+    mgr.init_training()
+    runner = mgr.train_runner()
+    xs, y = [torch.randn(batch_sz, 4)], torch.randn(batch_sz, 4)
+    return _time_per_call(lambda: runner.run(xs, y), n_steps)
+
+
+def bench_create_tensor(dtype, size, n_calls):
+    """Seconds per call to torch_util.tensor for an array of a given dtype and size."""
+
+    x = np.zeros(size, dtype=dtype)
+    return _time_per_call(lambda: torch_util.tensor(x), n_calls)
+
+
+def bench_run_epoch(n_batches, batch_sz, n_features, prefetch=0):
+    """Seconds per batch for a whole epoch of numpy batches."""
+
+    model = torch.nn.Linear(n_features, 4)
+    optim = optimizer.make(torch.optim.SGD, model, 1e-3)
+    mgr = batches.Manager(model, optim, torch.nn.functional.mse_loss)
+    mgr.init_training()
+    x = np.random.randn(batch_sz, n_features).astype(np.float32)
+    y = np.random.randn(batch_sz, 4).astype(np.float32)
+    dl = [(x, y)] * n_batches
+    start = time.perf_counter()
+    loop.run_epoch(mgr.train_runner(), dl, track_progress=False, prefetch=prefetch)
+    return (time.perf_counter() - start) / n_batches
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    n_steps = 2000 // scale
+    results = {'meta': _meta(), 'step': [], 'create_tensor': [], 'run_epoch': []}
+
+    for n_groups in (1, 4, 16):
+        for n_layers in (1, 16, 64):
+            for compiled in (False, True):
+                secs = bench_step(n_groups, n_layers, n_steps, compiled=compiled)
+                results['step'].append({
+                    'n_groups': n_groups,
+                    'n_tensors': 2 * n_groups * n_layers,
+                    'compiled': compiled,
+                    'secs_per_step': secs,
+                })
+
+    for dtype in ('int32', 'int64', 'float32', 'float64'):
+        for size in (1 << 10, 1 << 20):
+            secs = bench_create_tensor(dtype, size, n_steps)
+            results['create_tensor'].append({
+                'dtype': dtype,
+                'size': size,
+                'secs_per_call': secs,
+                'bytes_per_sec': size * np.dtype(dtype).itemsize / secs,
+            })
+
+    for prefetch in (0, 2):
+        secs = bench_run_epoch(n_steps, 64, 256, prefetch=prefetch)
+        results['run_epoch'].append({
+            'prefetch': prefetch,
+            'secs_per_batch': secs,
+            'batches_per_sec': 1 / secs,
+        })
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='run 10x fewer iterations')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+def _time_per_call(fn, n_calls, n_warmup=10):
+    for _ in range(n_warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        fn()
+    return (time.perf_counter() - start) / n_calls
+
+
+def _meta():
+    return {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'numpy': np.__version__,
+        'threads': torch.get_num_threads(),
+        'machine': platform.machine(),
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class BucketSampler(object):
+    """Batches of indices into examples, grouped by similar lengths.
+
+    Examples are shuffled, then split into chunks of chunk_batches batches.
+    Within a chunk they are sorted by length before cutting it into batches,
+    and the order of all the batches is shuffled again, so that each epoch
+    sees different batches in a different order but with little padding.
+    """
+
+    def __init__(self, lengths, batch_sz, chunk_batches=50, shuffle=True, seed=None):
+        if batch_sz < 1:
+            raise ValueError(f'batch_sz must be at least 1, was {batch_sz}')
+        if chunk_batches < 1:
+            raise ValueError(f'chunk_batches must be at least 1, was {chunk_batches}')
+        self.lengths = np.asarray(lengths)
+        self.batch_sz = batch_sz
+        self.chunk_batches = chunk_batches
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+
+    def __len__(self):
+        return -(-len(self.lengths) // self.batch_sz)
+
+    def __iter__(self):
+        n = len(self.lengths)
+        order = self.rng.permutation(n) if self.shuffle else np.arange(n)
+        chunk_sz = self.chunk_batches * self.batch_sz
+        batches = []
+        for start in range(0, n, chunk_sz):
+            chunk = order[start:start + chunk_sz]
+            chunk = chunk[np.argsort(-self.lengths[chunk], kind='stable')]
+            batches.extend(chunk[i:i + self.batch_sz] for i in range(0, len(chunk), self.batch_sz))
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+        return iter(batches)
+
+
+class BucketLoader(object):
+    """Padded, seq-first batches of variable length sequences, for loop.fit.
+
+    Each batch is a pair of the inputs, padded into a (max_len, batch_sz)
+    array, and the targets. Sequential targets, e.g. for language models,
+    are padded the same way if pad_targets, otherwise they are just stacked.
+
+    The share of real rather than padded elements so far is tracked, and
+    reported by efficiency.
+    """
+
+    def __init__(
+        self, xs, ys, batch_sz, chunk_batches=50, shuffle=True, seed=None,
+        pad_value=0, pad_targets=False, dtype=None,
+    ):
+        if len(xs) != len(ys):
+            raise ValueError(f'xs and ys must have the same length, were {len(xs)} and {len(ys)}')
+        self.xs = xs
+        self.ys = ys
+        self.lengths = np.array([len(x) for x in xs])
+        self.sampler = BucketSampler(self.lengths, batch_sz, chunk_batches, shuffle, seed)
+        self.pad_value = pad_value
+        self.pad_targets = pad_targets
+        self.dtype = dtype
+        self.n_real = 0
+        self.n_padded = 0
+
+    def __len__(self):
+        return len(self.sampler)
+
+    def __iter__(self):
+        for idxs in self.sampler:
+            x = pad([self.xs[i] for i in idxs], self.pad_value, self.dtype)
+            self.n_real += self.lengths[idxs].sum()
+            self.n_padded += x.size
+            targets = [self.ys[i] for i in idxs]
+            y = pad(targets, self.pad_value) if self.pad_targets else np.stack(targets)
+            yield x, y
+
+    def efficiency(self):
+        """The share of elements in the batches so far that were not padding."""
+        return self.n_real / self.n_padded if self.n_padded else 1.0
+
+
+def pad(seqs, pad_value=0, dtype=None):
+    """Pad sequences to the longest of them, in a seq-first (max_len, n_seqs) array."""
+
+    seqs = [np.asarray(seq) for seq in seqs]
+    dtype = dtype or np.result_type(*seqs)
+    max_len = max(len(seq) for seq in seqs)
+    out = np.full((max_len, len(seqs)) + seqs[0].shape[1:], pad_value, dtype=dtype)
+    for i, seq in enumerate(seqs):
+        out[:len(seq), i] = seq
+    return out
+
+
+def padding_efficiency(lengths, batches):
+    """The share of real elements when lengths are padded per batch of indices."""
+
+    lengths = np.asarray(lengths)
+    n_padded = sum(len(idxs) * lengths[idxs].max() for idxs in batches)
+    return lengths.sum() / n_padded if n_padded else 1.0
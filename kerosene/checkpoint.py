@@ -0,0 +1,133 @@
+import contextlib
+import os
+import threading
+import torch
+
+
+class Checkpointer(object):
+    """Periodically save training state to path, without blocking training.
+
+    Every so many training batches, the state of the model, the optimizer,
+    the schedule and the runner are copied off the training tensors. When
+    gradients are being accumulated, that waits for the next optimizer step. The
+    copies are then serialized and written by a background thread, into a
+    temporary file that replaces path when complete.
+
+    See loop.fit for usage, which also resumes from path if it exists. With
+    write off, it only resumes, e.g. in all but one of the processes of
+    distributed.fit, which would otherwise race to write the same path.
+    """
+
+    def __init__(self, path, every, write=True):
+        if every < 1:
+            raise ValueError(f'every must be at least 1, was {every}')
+        self.path = path
+        self.every = every
+        self.write = write
+        self.n_steps = 0
+        self.due = False
+        self._thread = None
+        self._error = None
+
+    def step(self, mgr, runner, epoch, batch):
+        """Count a training batch, and save if one is due."""
+        self.n_steps += 1
+        self.due = self.due or self.n_steps % self.every == 0
+        if self.write and self.due and not mgr.accumulating:
+            self.save(mgr, runner, epoch, batch)
+
+    def save(self, mgr, runner, epoch, batch):
+        """Snapshot the state after the given batch of the given epoch, then write it."""
+        state = snapshot(mgr)
+        state.update(
+            epoch=epoch, batch=batch, runner=runner.state_dict(), checkpoint_steps=self.n_steps)
+        self.due = False
+        self.wait()
+        self._thread = threading.Thread(target=self._write, args=(state,), daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        """Wait for any pending write, re-raising any failure."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def restore(self, mgr):
+        """Restore mgr from the latest checkpoint, returning the whole state."""
+        self.wait()
+        state = torch.load(self.path, map_location='cpu', weights_only=False)
+        restore(mgr, state)
+        self.n_steps = state.get('checkpoint_steps', 0)
+        self.due = False
+        return state
+
+    def _write(self, state):
+        tmp_path = f'{self.path}.tmp'
+        try:
+            torch.save(state, tmp_path)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self._error = e
+
+
+def snapshot(mgr):
+    """Copy the training state of a manager to host memory."""
+
+    state = {
+        'model': _copy(mgr.model.state_dict()),
+        'optim': _copy(mgr.optim.optim.state_dict()),
+        'iter': getattr(mgr.schedule, 'iter', 0),
+    }
+    if mgr.scaler is not None:
+        state['scaler'] = mgr.scaler.state_dict()
+    return state
+
+
+def restore(mgr, state):
+    """Load a snapshot back into a manager, and move its schedule to match."""
+
+    mgr.model.load_state_dict(state['model'])
+    mgr.optim.optim.load_state_dict(state['optim'])
+    if 'scaler' in state and mgr.scaler is not None:
+        mgr.scaler.load_state_dict(state['scaler'])
+    mgr.init_training(state['iter'])
+
+
+@contextlib.contextmanager
+def rollback(mgr, schedule):
+    """Train with schedule in place of the manager's own, then undo it all.
+
+    The training state is snapshotted in memory on entry. On exit it is
+    restored along with the manager's schedule, and every module is put back
+    in train or eval mode as it was.
+    """
+
+    state = snapshot(mgr)
+    modes = [(module, module.training) for module in mgr.model.modules()]
+    own_schedule = mgr.schedule
+    mgr.schedule = schedule
+    try:
+        mgr.init_training()
+        mgr.train_mode()
+        yield mgr
+    finally:
+        mgr.schedule = own_schedule
+        restore(mgr, state)
+        for module, training in modes:
+            module.training = training
+
+
+def _copy(x):
+    if torch.is_tensor(x):
+        return x.detach().to('cpu', copy=True)
+    if isinstance(x, dict):
+        return type(x)((k, _copy(v)) for k, v in x.items())
+    if isinstance(x, (list, tuple)):
+        return type(x)(_copy(v) for v in x)
+    return x
@@ -0,0 +1,142 @@
+import itertools
+import math
+import os
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from . import loop, metrics, torch_util
+
+
+def fit(
+    make_mgr, trn_dl, val_dl, n_epochs, n_procs,
+    n_nodes=1, node_rank=0, master_addr='127.0.0.1', master_port=29500,
+    backend='gloo', **kwargs
+):
+    """Data-parallel loop.fit, with n_procs worker processes on each of n_nodes.
+
+    Each worker builds its own batches.Manager by calling make_mgr, so that
+    and the loaders must be picklable. Its schedule is resized to the
+    optimizer steps over the shard of the training loader that each worker
+    trains on, see prepare.
+
+    Gradients are all-reduced after every backward pass, and the reported
+    losses and metrics are global. Validation covers every batch of val_dl,
+    spread across the workers. Only the first worker prints, and the final
+    validation results are returned on node 0.
+
+    With a checkpoint.Checkpointer, every worker resumes from its path, but
+    only the first one writes to it.
+
+    For multiple boxes, run this on each of them with its own node_rank,
+    and with master_addr set to an address of node 0 reachable by all.
+    """
+
+    results = mp.get_context('spawn').SimpleQueue()
+    mp.spawn(
+        _worker,
+        args=(
+            make_mgr, trn_dl, val_dl, n_epochs, n_procs, n_nodes, node_rank,
+            master_addr, master_port, backend, results, kwargs,
+        ),
+        nprocs=n_procs,
+    )
+    return results.get() if node_rank == 0 else None
+
+
+def _worker(
+    local_rank, make_mgr, trn_dl, val_dl, n_epochs, n_procs, n_nodes, node_rank,
+    master_addr, master_port, backend, results, kwargs,
+):
+    rank = node_rank*n_procs + local_rank
+    world_size = n_nodes * n_procs
+    torch.set_num_threads(max(1, os.cpu_count() // n_procs))
+    dist.init_process_group(
+        backend,
+        init_method=f'tcp://{master_addr}:{master_port}',
+        rank=rank,
+        world_size=world_size,
+    )
+    try:
+        trn_shard = Shard(trn_dl, rank, world_size)
+        val_shard = Shard(val_dl, rank, world_size, drop_last=False)
+        mgr = prepare(make_mgr(), trn_shard, n_epochs)
+        verbose = kwargs.pop('verbose', True) and rank == 0
+        if kwargs.get('checkpoint') is not None and rank != 0:
+            kwargs['checkpoint'].write = False
+        result = loop.fit(mgr, trn_shard, val_shard, n_epochs, verbose=verbose, **kwargs)
+        if rank == 0:
+            results.put(result)
+    finally:
+        dist.destroy_process_group()
+
+
+def prepare(mgr, trn_shard=None, n_epochs=1):
+    """Make a manager data-parallel, in an initialized process group.
+
+    Each process only sees a shard of the training batches, so if that is
+    given, the schedule is resized to the optimizer steps over n_epochs of it,
+    with gradients accumulated over mgr.accumulate batches per step.
+    """
+
+    mgr.model = torch.nn.parallel.DistributedDataParallel(mgr.model)
+    mgr.reduce = all_reduce_averages
+    if trn_shard is not None:
+        mgr.schedule.nb = n_epochs * math.ceil(len(trn_shard) / mgr.accumulate)
+    return mgr
+
+
+def all_reduce_averages(averages):
+    """The values of weighted averages or streaming metrics, combined across all processes."""
+
+    weighted = [
+        average for average in averages
+        if not isinstance(average, metrics.StreamingMetric)
+    ]
+    totals = torch.tensor([
+        [torch_util.materialize(average.numer), torch_util.materialize(average.denom)]
+        for average in weighted
+    ], dtype=torch.float64).reshape(-1, 2)
+    dist.all_reduce(totals)
+    weighted_values = iter([numer / denom for numer, denom in totals.tolist()])
+    return [
+        all_reduce_metric(average).value()
+        if isinstance(average, metrics.StreamingMetric) else next(weighted_values)
+        for average in averages
+    ]
+
+
+def all_reduce_metric(metric):
+    """A copy of a streaming metric, with statistics combined across all processes."""
+
+    state = metric.state.cpu().clone()
+    dist.all_reduce(state)
+    combined = metric.fresh()
+    combined.state = state
+    return combined
+
+
+class Shard(object):
+    """Every world_size-th batch of dl, starting from rank.
+
+    For training, every shard has the same length, so up to world_size-1
+    batches are dropped. Otherwise some processes would wait forever on the
+    others in the backward pass. Without drop_last, the first shards get one
+    extra batch each instead, e.g. for validation, which has no such waits.
+    """
+
+    def __init__(self, dl, rank, world_size, drop_last=True):
+        if not 0 <= rank < world_size:
+            raise ValueError(f'rank must be in [0, {world_size}), was {rank}')
+        self.dl = dl
+        self.rank = rank
+        self.world_size = world_size
+        self.drop_last = drop_last
+
+    def __len__(self):
+        n, extra = divmod(len(self.dl), self.world_size)
+        return n if self.drop_last or self.rank >= extra else n + 1
+
+    def __iter__(self):
+        stop = self.rank + self.world_size * len(self)
+        return itertools.islice(self.dl, self.rank, stop, self.world_size)
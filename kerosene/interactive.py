@@ -1,11 +1,11 @@
 import sys
-import tqdm as tq
-
-from ipykernel.kernelapp import IPKernelApp
+import time
 
 
 def in_notebook():
-    return IPKernelApp.initialized()
+    """Whether we run in a Jupyter kernel, without importing ipykernel to check."""
+    kernelapp = sys.modules.get('ipykernel.kernelapp')
+    return kernelapp is not None and kernelapp.IPKernelApp.initialized()
 
 
 def in_ipynb():
@@ -17,7 +17,8 @@ def in_ipynb():
 
 
 def clear_tqdm():
-    inst = getattr(tq.tqdm, '_instances', None)
+    tq = sys.modules.get('tqdm')
+    inst = None if tq is None else getattr(tq.tqdm, '_instances', None)
     if not inst:
         return
     try:
@@ -27,14 +28,17 @@ def clear_tqdm():
         pass
 
 
-def tqdm(*args, **kwargs):
+def tqdm(*args, clear=True, **kwargs):
+    import tqdm as tq
     if in_notebook():
-        clear_tqdm()
+        if clear:
+            clear_tqdm()
         return tq.tqdm(*args, file=sys.stdout, **kwargs)
     return tq.tqdm(*args, **kwargs)
 
 
 def trange(*args, **kwargs):
+    import tqdm as tq
     if in_notebook():
         clear_tqdm()
         return tq.trange(*args, file=sys.stdout, **kwargs)
@@ -43,5 +47,89 @@ def trange(*args, **kwargs):
 
 def tnrange(*args, **kwargs):
     if in_notebook():
-        return tq.tnrange(*args, **kwargs)
+        from tqdm.notebook import trange as notebook_trange
+        return notebook_trange(*args, **kwargs)
+    import tqdm as tq
     return tq.trange(*args, **kwargs)
+
+
+class Progress(object):
+    """Report progress through total steps, at most once every interval seconds.
+
+    The mode is 'bar' for a progress bar, 'log' for a line of text per interval,
+    e.g. in job logs, or 'silent'. True picks the bar in a terminal or notebook
+    and the log otherwise, and False is silent.
+
+    Postfix values come from a callable that is only called when they are due
+    to be shown, since computing them may need a copy back from the device.
+
+    Bars left over from interrupted runs in a notebook are not cleared here,
+    since that would also close any outer bar, see loop.fit.
+    """
+
+    def __init__(self, total, mode=True, interval=None, desc=None, file=None):
+        self.mode = _progress_mode(mode)
+        self.interval = _INTERVALS[self.mode] if interval is None else interval
+        self.total = total
+        self.desc = desc
+        self.file = file
+        self.n = 0
+        self.shown = 0
+        self.start = self.last = time.perf_counter()
+        self.bar = None
+        if self.mode == 'bar':
+            self.bar = tqdm(
+                total=total, desc=desc, leave=False, mininterval=0, miniters=1, clear=False)
+
+    def update(self, n=1, values=None):
+        self.n += n
+        if self.mode == 'silent':
+            return
+        now = time.perf_counter()
+        if now - self.last < self.interval:
+            return
+        self.last = now
+        self._show(now, values)
+
+    def close(self, values=None):
+        if self.mode == 'log' and self.n > self.shown:
+            self._show(time.perf_counter(), values)
+        if self.bar is not None:
+            self.bar.close()
+
+    def _show(self, now, values):
+        postfix = {} if values is None else values()
+        if self.bar is not None:
+            self.bar.set_postfix(postfix, refresh=False)
+            self.bar.update(self.n - self.shown)
+        else:
+            print(self._line(now, postfix), file=self.file or sys.stdout, flush=True)
+        self.shown = self.n
+
+    def _line(self, now, postfix):
+        elapsed = now - self.start
+        parts = [] if self.desc is None else [self.desc]
+        if self.total:
+            parts.append(f'{self.n}/{self.total} ({100 * self.n / self.total:.0f}%)')
+        else:
+            parts.append(f'{self.n}')
+        parts.append(f'{elapsed:.1f}s')
+        if elapsed > 0:
+            parts.append(f'{self.n / elapsed:.1f} it/s')
+        for k, v in postfix.items():
+            parts.append(f'{k}={v:.6g}' if isinstance(v, float) else f'{k}={v}')
+        return ' '.join(parts)
+
+
+_MODES = ('bar', 'log', 'silent')
+_INTERVALS = {'bar': 0.1, 'log': 10, 'silent': 0}
+
+
+def _progress_mode(mode):
+    if mode is True:
+        return 'bar' if in_notebook() or sys.stderr.isatty() else 'log'
+    if mode is False or mode is None:
+        return 'silent'
+    if mode not in _MODES:
+        raise ValueError(f'mode must be one of {_MODES}, was {mode!r}')
+    return mode
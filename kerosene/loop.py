@@ -1,51 +1,292 @@
+import itertools
+import math
+import time
 import numpy as np
+import torch
+import torch.distributed as dist
 
-from . import batches, optimizer, sched, torch_util
-from .interactive import tnrange, tqdm
+from . import batches, optimizer, sched, timing, torch_util, util
+from .interactive import Progress, clear_tqdm, in_notebook
 
 
 def fit_and_finish(
     model, opt_fn, loss_fn,
     trn_dl, val_dl, n_epochs, lr,
-    metrics=None, seq_first=False
+    metrics=None, seq_first=False, accumulate=1, micro_batches=1, precision=None
 ):
-    n_batches = n_epochs * len(trn_dl)
+    n_batches = n_epochs * math.ceil(len(trn_dl) / accumulate)
     optim = optimizer.make(opt_fn, model, lr)
     schedule = sched.one_cycle(optim, n_batches, momentums=(0.95, 0.85))
-    mgr = batches.Manager(model, optim, loss_fn, schedule, metrics, seq_first)
+    mgr = batches.Manager(
+        model, optim, loss_fn, schedule, metrics, seq_first,
+        accumulate=accumulate, micro_batches=micro_batches, precision=precision)
     return fit(mgr, trn_dl, val_dl, n_epochs)
 
 
-def fit(mgr, trn_dl, val_dl, n_epochs):
-    mgr.init_training()
-    for epoch in tnrange(n_epochs, desc='Epoch'):
-        train_loss, _ = run_epoch(mgr.train_runner(), trn_dl)
+def fit(
+    mgr, trn_dl, val_dl, n_epochs,
+    prefetch=0, verbose=True, checkpoint=None,
+    val_every=None, val_secs=None, val_batches=None, val_rotate=False, progress=True,
+    progress_secs=None,
+):
+    """Train for n_epochs, validating after each one.
 
-        with torch_util.no_grad():
-            val_loss, val_metrics = run_epoch(mgr.eval_runner(), val_dl, track_progress=False)
+    If a checkpoint.Checkpointer is given, it saves the state of training
+    periodically, and if it already has a saved state then we resume from there.
+
+    Instead of after each epoch, validation can run every val_every training
+    batches and/or every val_secs seconds. Each validation can also be limited
+    to val_batches batches, either always the first ones or, with val_rotate,
+    successive windows cycling through val_dl. Partial validations are marked
+    with a * in the printed table, and a full one is added at the very end.
+    Validations in the middle of an epoch start from a reset model, and any
+    state it keeps between batches is then put back for training, see
+    batches.Manager.keep_state.
+
+    Progress through the epochs, and within each of them, is shown per
+    interactive.Progress, in the given mode, at most once every progress_secs,
+    whenever verbose.
+    """
+
+    start_epoch, skip, runner_state = 0, 0, None
+    if checkpoint is not None and checkpoint.exists():
+        state = checkpoint.restore(mgr)
+        start_epoch, skip, runner_state = state['epoch'], state['batch'], state['runner']
+    else:
+        mgr.init_training()
+
+    evaluator = _Evaluator(mgr, val_dl, prefetch, val_every, val_secs, val_batches, val_rotate)
+    table = _Table(mgr, verbose)
+    progress = progress if verbose else False
+    if progress and in_notebook():
+        clear_tqdm()
+    epochs = Progress(n_epochs - start_epoch, mode=progress, desc='Epoch')
+    for epoch in range(start_epoch, n_epochs):
+        runner = mgr.train_runner()
+        if runner_state is not None:
+            runner.load_state_dict(runner_state)
+            runner_state = None
+
+        def on_batch(batch):
+            if checkpoint is not None:
+                checkpoint.step(mgr, runner, epoch, batch)
+            if evaluator.due():
+                with mgr.keep_state():
+                    values, partial = evaluator.evaluate()
+                mgr.train_mode(reset=False)
+                position = f'{epoch + batch/len(trn_dl):.2f}'
+                values = [runner.running_value()] + values
+                table.row(position, partial, values, mgr.timer.breakdown())
+
+        train_loss, _ = run_epoch(
+            runner, trn_dl, track_progress=progress, prefetch=prefetch,
+            skip=skip, on_batch=on_batch, progress_secs=progress_secs)
+        skip = 0
+
+        if not evaluator.interval:
+            values, partial = evaluator.evaluate()
+            table.row(epoch, partial, [train_loss] + values, mgr.timer.breakdown())
+        mgr.timer.end_epoch()
+        epochs.update()
+    epochs.close()
+
+    if evaluator.interval or evaluator.n_batches is not None:
+        values, _ = evaluator.evaluate(full=True)
+        table.row('final', False, [train_loss] + values)
+    if checkpoint is not None:
+        checkpoint.wait()
+    return values[0], values[1:]
+
+
+def run_epoch(
+    runner, dl, track_progress=True, prefetch=0, skip=0, on_batch=None, progress_secs=None,
+):
+    """Run every batch in dl through the runner.
+
+    Progress is reported per interactive.Progress, with track_progress as the
+    mode, at most once every progress_secs. The running loss is only fetched
+    when it is about to be shown.
+
+    If prefetch is positive, up to that many batches are converted and
+    copied to the device on a background thread while the current one runs.
 
-        if epoch == 0:
-            _print_names(mgr.metrics)
-        _print_stats(epoch, [train_loss] + [val_loss] + val_metrics)
+    The first skip batches are passed over, e.g. when resuming mid-epoch.
+    After each batch, on_batch is called with the number of batches done.
+    """
 
-    return val_loss, val_metrics
+    total = len(dl) - skip
+    if skip:
+        dl = itertools.islice(dl, skip, None)
+    progress = Progress(total, mode=track_progress, interval=progress_secs)
 
+    def postfix():
+        return {'loss': runner.running_value()}
 
-def run_epoch(runner, dl, track_progress=True):
-    batches = tqdm(dl, leave=False, total=len(dl), miniters=0) if track_progress else dl
-    for *x, y in batches:
-        loss = runner.run(torch_util.variable(x), torch_util.variable(y))
-        if track_progress:
-            batches.set_postfix(loss=loss, refresh=False)
+    for i, (x, y) in enumerate(variables(dl, prefetch, runner.timer), skip + 1):
+        runner.run(x, y)
+        progress.update(values=postfix)
+        if on_batch is not None:
+            on_batch(i)
+    runner.flush()
+    progress.close(values=postfix)
     return runner.report()
 
 
-def _print_names(metrics):
-    _print_wide(['epoch', 'trn_loss', 'val_loss'] + [fn.__name__ for fn in metrics])
+def predict(mgr, dl, prefetch=0):
+    """Stream the predictions for dl, yielding a numpy array per batch.
+
+    Each batch is either an array of inputs or a list of them, without labels.
+    Predictions are computed in inference mode and never accumulated here.
+    """
+
+    mgr.eval_mode()
+    for xs in variables(dl, prefetch, mgr.timer, convert=torch_util.variable_inputs):
+        with torch_util.inference_mode():
+            preds = mgr.predict(xs)
+        yield _numpy(preds)
+
+
+def predict_into(mgr, dl, out, prefetch=0):
+    """Write the predictions for dl into out, e.g. a numpy memmap.
+
+    Batches are written consecutively along the batch axis of out, which is
+    the second one for seq_first models. Returns the number of rows written.
+    """
+
+    axis = 1 if mgr.seq_first else 0
+    index = [slice(None)] * out.ndim
+    n_rows = 0
+    for preds in predict(mgr, dl, prefetch):
+        batch_sz = preds.shape[axis]
+        index[axis] = slice(n_rows, n_rows + batch_sz)
+        out[tuple(index)] = preds
+        n_rows += batch_sz
+    return n_rows
+
+
+def _numpy(x):
+    x = x.detach().cpu()
+    return (x.float() if x.dtype == torch.bfloat16 else x).numpy()
+
+
+def variables(dl, prefetch=0, timer=timing.NO_TIMER, convert=None):
+    """Convert the batches of dl to tensors on the device, as run_epoch does.
+
+    Each batch is inputs then targets, unless another convert is given. With
+    prefetch, batches are converted ahead on a background thread, see
+    util.prefetch. The timer records the time spent waiting on dl.
+    """
+
+    convert = convert or torch_util.variable_batch
+    if prefetch:
+        batches = (convert(batch, pin=True) for batch in dl)
+        yield from timer.iterate(util.prefetch(batches, prefetch), 'data')
+        return
+    for batch in timer.iterate(dl, 'data'):
+        with timer.phase('convert'):
+            converted = convert(batch)
+        yield converted
+
+
+class _Evaluator(object):
+    """Decide when to validate and on which batches, then do it."""
+
+    def __init__(self, mgr, dl, prefetch, every, secs, n_batches, rotate):
+        self.mgr = mgr
+        self.dl = dl
+        self.prefetch = prefetch
+        self.every = every
+        self.secs = secs
+        self.n_batches = n_batches
+        self.rotate = rotate
+        self.interval = every is not None or secs is not None
+        self.offset = 0
+        self.n_steps = 0
+        self.last_step = 0
+        self.last_time = time.perf_counter()
+
+    def due(self):
+        self.n_steps += 1
+        if self.every is not None and self.n_steps - self.last_step >= self.every:
+            return True
+        if self.secs is None:
+            return False
+        return _first_rank_decides(time.perf_counter() - self.last_time >= self.secs)
+
+    def evaluate(self, full=False):
+        dl, partial = (self.dl, False) if full else self._sample()
+        with torch_util.no_grad():
+            loss, metrics = run_epoch(
+                self.mgr.eval_runner(), dl, track_progress=False, prefetch=self.prefetch)
+        self.last_step = self.n_steps
+        self.last_time = time.perf_counter()
+        return [loss] + metrics, partial
+
+    def _sample(self):
+        n_batches = self.n_batches
+        if n_batches is None or n_batches >= len(self.dl):
+            return self.dl, False
+        start = self.offset
+        if self.rotate:
+            self.offset = (start + n_batches) % len(self.dl)
+        return _Window(self.dl, start, n_batches), True
+
+
+def _first_rank_decides(flag):
+    """The flag of the first process in the process group, if any, for all of them.
+
+    Clocks differ between processes, which must still validate on the same
+    batches, or they would wait on each other in different collectives.
+    """
+    if not dist.is_available() or not dist.is_initialized():
+        return flag
+    device = 'cuda' if dist.get_backend() == 'nccl' else 'cpu'
+    decision = torch.tensor([flag], dtype=torch.int64, device=device)
+    dist.broadcast(decision, 0)
+    return bool(decision.item())
+
+
+class _Window(object):
+    """The n batches of dl from start, wrapping around at the end."""
+
+    def __init__(self, dl, start, n):
+        self.dl = dl
+        self.start = start
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return itertools.islice(itertools.chain(self.dl, self.dl), self.start, self.start + self.n)
+
+
+class _Table(object):
+    """Print rows of stats, starting with the header."""
+
+    def __init__(self, mgr, verbose):
+        self.mgr = mgr
+        self.verbose = verbose
+        self.started = False
+
+    def row(self, label, partial, values, breakdown=None):
+        if not self.verbose:
+            return
+        if not self.started:
+            with_breakdown = self.mgr.timer.breakdown() is not None
+            _print_names(self.mgr.metrics, with_breakdown=with_breakdown)
+            self.started = True
+        _print_stats(f'{label}*' if partial else label, values, breakdown=breakdown)
+
+
+def _print_names(metrics, with_breakdown=False):
+    breakdown = ['breakdown'] if with_breakdown else []
+    _print_wide(['epoch', 'trn_loss', 'val_loss'] + [fn.__name__ for fn in metrics] + breakdown)
 
 
-def _print_stats(epoch, values, decimals=6):
-    _print_wide([epoch] + list(np.round(values, decimals)), ralign_first=True)
+def _print_stats(epoch, values, decimals=6, breakdown=None):
+    extras = [] if breakdown is None else [breakdown]
+    _print_wide([epoch] + list(np.round(values, decimals)) + extras, ralign_first=True)
 
 
 def _print_wide(vals, ralign_first=False, decimals=6):
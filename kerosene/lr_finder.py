@@ -0,0 +1,54 @@
+import itertools
+import math
+import numpy as np
+
+from . import batches, checkpoint, loop, sched, shape, torch_util
+
+
+def find(mgr, dl, start_lr=1e-7, end_lr=10, n_steps=100, ema_window=20, div_factor=4):
+    """Suggest an lr for each param group from a short range test.
+
+    The lr rises exponentially from start_lr to end_lr over n_steps optimizer
+    steps, cycling through dl as needed. Groups keep their current ratios, so
+    start_lr and end_lr apply to the group with the highest lr. The run stops
+    early once the smoothed loss exceeds div_factor times the best so far.
+
+    Nothing about the manager changes, see checkpoint.rollback. Returns the
+    suggested lrs, which are a tenth of those at the lowest smoothed loss, then
+    the lrs and smoothed losses at every step for closer inspection.
+    """
+
+    if n_steps < 1:
+        raise ValueError(f'n_steps must be at least 1, was {n_steps}')
+    if not 0 < start_lr < end_lr:
+        raise ValueError(f'need 0 < start_lr < end_lr, was {start_lr} and {end_lr}')
+    if len(dl) == 0:
+        raise ValueError('dl must not be empty')
+
+    top_lr = mgr.optim.get_lrs().max()
+    schedule = sched.Schedule(mgr.optim, n_steps, {
+        'lr': shape.exp(start_lr / top_lr, end_lr / top_lr),
+    })
+    with checkpoint.rollback(mgr, schedule):
+        lrs, losses = _range_test(mgr, dl, n_steps, ema_window, div_factor)
+
+    best = int(np.nanargmin(losses))
+    return lrs[best] / 10, lrs, losses
+
+
+def _range_test(mgr, dl, n_steps, ema_window, div_factor):
+    running_loss = batches.ExponentialMovingAverage(ema_window)
+    best_loss = math.inf
+    lrs, losses = [], []
+    forever = itertools.chain.from_iterable(itertools.repeat(dl))
+    for x, y in loop.variables(forever, timer=mgr.timer):
+        lrs.append(mgr.optim.get_lrs())
+        loss, _ = mgr.step(x, y, with_step=True)
+        smoothed = running_loss.update(torch_util.materialize(loss))
+        losses.append(smoothed)
+        if not math.isfinite(smoothed) or smoothed > div_factor * best_loss:
+            break
+        best_loss = min(best_loss, smoothed)
+        if mgr.schedule.iter >= n_steps:
+            break
+    return np.array(lrs), np.array(losses)
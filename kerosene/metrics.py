@@ -0,0 +1,169 @@
+import abc
+import copy
+import torch
+
+
+class StreamingMetric(abc.ABC):
+    """A metric accumulated from compact sufficient statistics, batch by batch.
+
+    The statistics are kept as a tensor of counts in state, on the same device
+    as the predictions, so two metrics are merged by adding their states, also
+    across processes. Pass instances as metrics to batches.Manager.
+    """
+
+    def __init__(self, name, state):
+        self.__name__ = name
+        self.state = state
+
+    @abc.abstractmethod
+    def update(self, preds, y):
+        """Add the statistics for a batch of predictions and targets."""
+        pass
+
+    @abc.abstractmethod
+    def compute(self):
+        """The metric value over everything seen so far."""
+        pass
+
+    def merge(self, other):
+        self.state = self.state + other.state.to(self.state.device)
+        return self
+
+    def fresh(self):
+        """A copy of this metric, with no statistics accumulated yet."""
+        metric = copy.copy(self)
+        metric.state = torch.zeros_like(self.state)
+        return metric
+
+    def value(self):
+        return float(self.compute())
+
+    def state_dict(self):
+        return {'state': self.state.to('cpu', copy=True)}
+
+    def load_state_dict(self, state):
+        self.state = state['state'].to(self.state.device, copy=True)
+
+    def _add(self, counts):
+        if self.state.device != counts.device:
+            self.state = self.state.to(counts.device)
+        self.state += counts
+
+
+class AUC(StreamingMetric):
+    """Area under the ROC curve for binary targets, from a histogram of scores.
+
+    Scores are binned into n_bins equal bins over [0, 1], which bounds the
+    error by the share of pairs of examples landing in the same bin. Pairs
+    within a bin count as ties. With from_logits, scores go through a sigmoid.
+    """
+
+    def __init__(self, n_bins=1000, from_logits=False):
+        super().__init__('auc', torch.zeros(2, n_bins, dtype=torch.int64))
+        self.n_bins = n_bins
+        self.from_logits = from_logits
+
+    def update(self, preds, y):
+        scores = preds.detach().reshape(-1).float()
+        if self.from_logits:
+            scores = torch.sigmoid(scores)
+        bins = (scores * self.n_bins).long().clamp_(0, self.n_bins - 1)
+        index = y.reshape(-1).long() * self.n_bins + bins
+        self._add(torch.bincount(index, minlength=2 * self.n_bins).view(2, self.n_bins))
+
+    def compute(self):
+        neg, pos = self.state.double()
+        neg_below = torch.cumsum(neg, 0) - neg
+        wins = (pos * (neg_below + neg / 2)).sum()
+        return (wins / (pos.sum() * neg.sum())).item()
+
+
+class ConfusionMatrix(StreamingMetric):
+    """Counts of targets (rows) against predicted classes (columns).
+
+    Predictions are either scores per class, with the class on the last
+    dimension, or a single score per example which is compared to threshold.
+    Subclasses compute a metric from the counts, averaged over classes as
+    'macro', pooled over classes as 'micro', or just for class 1 as 'binary'.
+    The counts themselves are in state.
+    """
+
+    def __init__(self, name, n_classes=2, average='macro', threshold=0.5):
+        if average not in ('macro', 'micro', 'binary'):
+            raise ValueError(f'average must be macro, micro or binary, was {average}')
+        super().__init__(name, torch.zeros(n_classes, n_classes, dtype=torch.int64))
+        self.n_classes = n_classes
+        self.average = average
+        self.threshold = threshold
+
+    def update(self, preds, y):
+        preds = preds.detach()
+        y = y.reshape(-1).long()
+        if preds.dim() > 1 and preds.shape[-1] > 1:
+            labels = preds.reshape(-1, preds.shape[-1]).argmax(-1)
+        else:
+            labels = (preds.reshape(-1) >= self.threshold).long()
+        index = y * self.n_classes + labels
+        counts = torch.bincount(index, minlength=self.n_classes ** 2)
+        self._add(counts.view(self.n_classes, self.n_classes))
+
+    def _counts(self):
+        counts = self.state.double()
+        tp = counts.diagonal()
+        fp = counts.sum(0) - tp
+        fn = counts.sum(1) - tp
+        if self.average == 'micro':
+            return tp.sum(), fp.sum(), fn.sum()
+        if self.average == 'binary':
+            return tp[1], fp[1], fn[1]
+        return tp, fp, fn
+
+    def _average(self, numer, denom):
+        ratio = numer / denom
+        return torch.nan_to_num(ratio).mean().item()
+
+
+class Precision(ConfusionMatrix):
+    def __init__(self, n_classes=2, average='macro', threshold=0.5):
+        super().__init__('precision', n_classes, average, threshold)
+
+    def compute(self):
+        tp, fp, _ = self._counts()
+        return self._average(tp, tp + fp)
+
+
+class Recall(ConfusionMatrix):
+    def __init__(self, n_classes=2, average='macro', threshold=0.5):
+        super().__init__('recall', n_classes, average, threshold)
+
+    def compute(self):
+        tp, _, fn = self._counts()
+        return self._average(tp, tp + fn)
+
+
+class F1(ConfusionMatrix):
+    def __init__(self, n_classes=2, average='macro', threshold=0.5):
+        super().__init__('f1', n_classes, average, threshold)
+
+    def compute(self):
+        tp, fp, fn = self._counts()
+        return self._average(2 * tp, 2*tp + fp + fn)
+
+
+class TopK(StreamingMetric):
+    """Exact top-k accuracy, from counts of hits and examples."""
+
+    def __init__(self, k=1):
+        super().__init__(f'top{k}', torch.zeros(2, dtype=torch.int64))
+        self.k = k
+
+    def update(self, preds, y):
+        preds = preds.detach()
+        preds = preds.reshape(-1, preds.shape[-1])
+        y = y.reshape(-1, 1).long()
+        hits = (preds.topk(self.k, dim=-1).indices == y).any(-1).sum()
+        self._add(torch.stack([hits, hits.new_tensor(len(y))]))
+
+    def compute(self):
+        hits, total = self.state.tolist()
+        return hits / total
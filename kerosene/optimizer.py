@@ -1,19 +1,27 @@
 import numpy as np
+import torch
 
-from . import util
+from . import torch_util, util
 
 
-def make(opt_fn, layer_groups, lrs, wds=0):
+def make(opt_fn, layer_groups, lrs, wds=0, flat=False, zero_mode='default'):
     """Create a programmable optimizer based on the input config.
 
     An optimizer produced by opt_fn will be used to update model params,
     which are split up into different layer_groups. That can also just
     be the entire model. The optimizer is then initialized with lr and
     wds set on a per-group basis, with broadcasting for atomic values.
+
+    If flat, the params of each group are moved into one contiguous buffer,
+    as are their grads, so that group-wide updates run as single kernels.
+    The modules keep views into those buffers, so the model must already be
+    on its device, and its grads must only be zeroed through the optimizer.
+
+    See ProgrammableOptimizer for the choices of zero_mode.
     """
 
     layer_groups = util.listify(layer_groups)
-    return ProgrammableOptimizer(opt_fn([
+    groups = [
         {
             'params': _trainable_params(layer_group),
             'lr': lr,
@@ -24,39 +32,149 @@ def make(opt_fn, layer_groups, lrs, wds=0):
             util.list_along(lrs, layer_groups),
             util.list_along(wds, layer_groups),
         )
-    ]))
+    ]
+    if flat:
+        groups = [_flatten(group) for group in groups]
+    return ProgrammableOptimizer(opt_fn(groups), zero_mode=zero_mode)
 
 
 def _trainable_params(group):
     return [p for layer in util.listify(group) for p in layer.parameters() if p.requires_grad]
 
 
+def _flatten(group):
+    """Replace the params of a group with one flat param, leaving views behind.
+
+    Grads are allocated up front as views of the flat grad too, so they must
+    only ever be zeroed in place, e.g. by ProgrammableOptimizer.zero_grad.
+    The views are kept on the flat param, see _FlatViews.
+    """
+
+    params = group['params']
+    if not params:
+        return group
+    if len({(p.dtype, p.device) for p in params}) > 1:
+        raise ValueError('params must share a dtype and device to be flattened')
+    flat = torch.nn.Parameter(torch.cat([p.detach().reshape(-1) for p in params]))
+    flat.grad = torch.zeros_like(flat)
+    offset = 0
+    for p in params:
+        n = p.numel()
+        p.data = flat.data[offset:offset + n].view_as(p)
+        p.grad = flat.grad[offset:offset + n].view_as(p)
+        offset += n
+    flat.views = _FlatViews(flat, params)
+    return dict(group, params=[flat], flat=True)
+
+
+class _FlatViews(object):
+    """The params viewing a flat param, and which of them got grads since zeroing.
+
+    Since their grads are never None, hooks record which params backward
+    reaches, e.g. so that weight decay still skips the others.
+    """
+
+    def __init__(self, flat, params):
+        self.flat = flat
+        self.params = params
+        self.used = [False] * len(params)
+        for i, p in enumerate(params):
+            p.register_hook(self._use(i))
+
+    def _use(self, i):
+        def hook(grad):
+            self.used[i] = True
+        return hook
+
+    def reset(self):
+        self.used = [False] * len(self.params)
+
+    def decayed(self):
+        """The data of the params with grads, in as few tensors as possible."""
+        if all(self.used):
+            return [self.flat.data]
+        return [p.data for p, used in zip(self.params, self.used) if used]
+
+    def check(self):
+        """Raise if any param or grad was moved off the flat buffers."""
+        size = self.flat.element_size()
+        offset = 0
+        for p in self.params:
+            data_ptr = self.flat.data_ptr() + offset * size
+            grad_ptr = self.flat.grad.data_ptr() + offset * size
+            if p.data_ptr() != data_ptr or p.grad is None or p.grad.data_ptr() != grad_ptr:
+                raise RuntimeError(
+                    'params of a flat group no longer view its buffers, e.g. after model.to '
+                    'or zero_grad(set_to_none=True): make the optimizer after moving the '
+                    'model, and zero grads through it')
+            offset += p.numel()
+
+
+_ZERO_MODES = ('default', 'none', 'foreach')
+
+
 class ProgrammableOptimizer(object):
     """Make it easy to program the parameters of a PyTorch optimizer.
 
     The parameters here are well suited for automation via the shape package.
     See sched.clr for an example usage.
+
+    Grads are zeroed per the zero_mode, which is 'default' to pass through to
+    the inner optimizer, 'none' to free them by setting them to None, or
+    'foreach' to zero them in place with as few kernels as possible. Grads of
+    flat groups are always zeroed in place, since the modules hold views.
     """
 
-    def __init__(self, optim):
+    def __init__(self, optim, zero_mode='default'):
+        if zero_mode not in _ZERO_MODES:
+            raise ValueError(f'zero_mode must be one of {_ZERO_MODES}, was {zero_mode}')
         self.optim = optim
+        self.zero_mode = zero_mode
 
     @property
     def params(self):
         return self.optim.param_groups[0].keys()
 
+    @property
+    def param_groups(self):
+        """Pass-through for e.g. loss scalers, which unscale grads by group."""
+        return self.optim.param_groups
+
     def zero_grad(self):
-        """Convenient pass-through to the inner optimizer."""
-        self.optim.zero_grad()
+        """Zero all grads, per the zero_mode."""
+        groups = self.optim.param_groups
+        flat = [
+            p.grad for group in groups if group.get('flat')
+            for p in group['params'] if p.grad is not None
+        ]
+        if self.zero_mode == 'default' and not flat:
+            self.optim.zero_grad()
+            return
+        for group in groups:
+            if group.get('flat'):
+                group['params'][0].views.reset()
+        rest = [
+            p for group in groups if not group.get('flat')
+            for p in group['params'] if p.grad is not None
+        ]
+        if self.zero_mode == 'foreach':
+            torch_util.foreach_zero_(flat + [p.grad for p in rest])
+            return
+        torch_util.foreach_zero_(flat)
+        for p in rest:
+            p.grad = None
 
     def step(self):
-        """Apply weight decay, then pass- hrough to the inner optimizer.
+        """Apply weight decay, then pass-through to the inner optimizer.
 
         This is the idea proposed in AdamW. This has a similar effect on
         weights as if they were just added to the loss, but without
         messing with adaptive gradient methods like RMSProp or Adam.
         """
 
+        for group in self.optim.param_groups:
+            if group.get('flat'):
+                group['params'][0].views.check()
         if 'wd' in self.params:
             self._apply_weight_decay()
         self.optim.step()
@@ -66,9 +184,21 @@ class ProgrammableOptimizer(object):
             decay = group['lr'] * group['wd']
             if decay == 0:
                 continue
-            for param in group['params']:
-                if param.grad is not None:
-                    param.data.sub_(decay)
+            if group.get('flat'):
+                params = group['params'][0].views.decayed()
+            else:
+                params = [p.data for p in group['params'] if p.grad is not None]
+            torch_util.foreach_mul_(params, 1 - decay)
+
+    def scale_grads(self, factor):
+        """Scale all gradients in place, e.g. to average accumulated batches."""
+        grads = [
+            p.grad.data
+            for group in self.optim.param_groups
+            for p in group['params']
+            if p.grad is not None
+        ]
+        torch_util.foreach_mul_(grads, factor)
 
     def get_param(self, key):
         return np.array([pg[key] for pg in self.optim.param_groups])
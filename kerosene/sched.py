@@ -1,3 +1,5 @@
+import numpy as np
+
 from . import shape, util
 
 
@@ -9,16 +11,24 @@ class Schedule(object):
 
     This is still using a custom counter to track steps within a cycle,
     it would be better to inject that value as a method parameter.
+
+    If compiled, the per-step values for every parameter and group are
+    tabulated up front, so that each step is just a lookup and a write.
     """
 
-    def __init__(self, optim, nb, param_shapes):
+    def __init__(self, optim, nb, param_shapes, compiled=False):
         self.nb = nb
         self.optim = optim
         self.init_lrs = None if optim is None else optim.get_lrs()
         self.param_shapes = param_shapes
-
-    def init_training(self):
-        self.iter = 0
+        self.compiled = compiled
+        self.tables = None
+
+    def init_training(self, start=0):
+        """Start at step 0, or at a later step e.g. when resuming."""
+        self.iter = start
+        if self.compiled:
+            self.tables = self._compile()
         self._set_params()
 
     def step(self):
@@ -27,41 +37,63 @@ class Schedule(object):
         self.iter += 1
         self._set_params()
 
+    def _compile(self):
+        if not self.param_shapes:
+            return {}
+        n_groups = len(self.init_lrs)
+        xs = np.arange(self.nb + 1) / self.nb
+        tables = {}
+        for param, shape_fn in self.param_shapes.items():
+            scale = self.init_lrs if param == 'lr' else np.ones(n_groups)
+            tables[param] = np.outer(shape_fn.evaluate(xs), scale).astype(np.float32)
+        return tables
+
     def _set_params(self):
+        if self.tables is not None:
+            for param, table in self.tables.items():
+                self._set_param(param, table[self.iter].tolist())
+            return
         for param, shape_fn in self.param_shapes.items():
             interp = shape_fn(self.iter / self.nb)
             if param == 'lr':
-                self.optim.set_lrs(self.init_lrs * interp)
-            elif param == 'momentum':
-                self.optim.set_momentums(interp)
-            elif param == 'wd':
-                self.optim.set_wds(interp)
-            else:
-                raise NotImplementedError(f'unsupported param: {param}')
+                interp = self.init_lrs * interp
+            self._set_param(param, interp)
+
+    def _set_param(self, param, vals):
+        if param == 'lr':
+            self.optim.set_lrs(vals)
+        elif param == 'momentum':
+            self.optim.set_momentums(vals)
+        elif param == 'wd':
+            self.optim.set_wds(vals)
+        else:
+            raise NotImplementedError(f'unsupported param: {param}')
 
 
 def nop():
     return Schedule(None, 0, {})
 
 
-def clr(optim, nb, lr_factor=10, momentums=None, wds=None):
-    return Schedule(optim, nb, _filter_nones({
+def clr(optim, nb, lr_factor=10, momentums=None, wds=None, compiled=False):
+    return Schedule(optim, nb, compiled=compiled, param_shapes=_filter_nones({
         'lr': shape.clr(lr_factor),
         'momentum': _tuple_shape(momentums),
         'wd': _tuple_shape(wds),
     }))
 
 
-def stlr(optim, nb, lr_factor=10, up_share=1/4, momentums=None, wds=None):
-    return Schedule(optim, nb, _filter_nones({
+def stlr(optim, nb, lr_factor=10, up_share=1/4, momentums=None, wds=None, compiled=False):
+    return Schedule(optim, nb, compiled=compiled, param_shapes=_filter_nones({
         'lr': shape.stlr(lr_factor, up_share),
         'momentum': _tuple_shape(momentums),
         'wd': _tuple_shape(wds),
     }))
 
 
-def burn_in(optim, nb, lr_factor=10, up_share=1/10, momentum=None, wd=None):
-    return Schedule(optim, nb, _filter_nones({
+def burn_in(
+    optim, nb, lr_factor=10, up_share=1/10, momentum=None, wd=None, compiled=False
+):
+    return Schedule(optim, nb, compiled=compiled, param_shapes=_filter_nones({
         'lr': shape.burn_in(lr_factor, up_share=up_share),
         'momentum': None if momentum is None else shape.const(momentum),
         'wd': None if wd is None else shape.const(wd),
@@ -76,8 +108,9 @@ def one_cycle(
     anneal_share=1/10,
     anneal_factor=100,
     wds=None,
+    compiled=False,
 ):
-    return Schedule(optim, nb, _filter_nones({
+    return Schedule(optim, nb, compiled=compiled, param_shapes=_filter_nones({
         'lr': shape.one_cycle(lr_factor, anneal_share, anneal_factor),
         'momentum': shape.one_cycle_momentum(momentums[0], momentums[1], anneal_share),
         'wd': _tuple_shape(wds),
@@ -1,4 +1,5 @@
 import abc
+import numpy as np
 
 
 class Shape(abc.ABC):
@@ -12,11 +13,22 @@ class Shape(abc.ABC):
     def range(self):
         pass
 
+    def compute_all(self, xs):
+        """Vectorized compute over an array, override with array arithmetic."""
+        return np.array([self.compute(x) for x in xs.flat], dtype=float).reshape(xs.shape)
+
     def __call__(self, x):
         if x < 0 or x > 1:
             raise ValueError('x must be in [0, 1], was {}'.format(x))
         return self.compute(x)
 
+    def evaluate(self, xs):
+        """Vectorized __call__ for an array of positions in [0, 1]."""
+        xs = np.asarray(xs, dtype=float)
+        if np.any((xs < 0) | (xs > 1)):
+            raise ValueError('xs must be in [0, 1], was {}'.format((xs.min(), xs.max())))
+        return self.compute_all(xs)
+
 
 class ConstantShape(Shape):
     """A constant shape of 1, i.e. the identity transformation."""
@@ -24,6 +36,9 @@ class ConstantShape(Shape):
     def compute(self, x):
         return 1
 
+    def compute_all(self, xs):
+        return np.ones_like(xs)
+
     def range(self):
         return (1, 1)
 
@@ -34,10 +49,31 @@ class LineShape(Shape):
     def compute(self, x):
         return x
 
+    def compute_all(self, xs):
+        return xs.copy()
+
     def range(self):
         return (0, 1)
 
 
+class ExponentialShape(Shape):
+    """The shape of a geometric progression from 1 to ratio."""
+
+    def __init__(self, ratio):
+        if ratio <= 0:
+            raise ValueError('ratio must be positive, was {}'.format(ratio))
+        self.ratio = ratio
+
+    def compute(self, x):
+        return self.ratio ** x
+
+    def compute_all(self, xs):
+        return np.power(float(self.ratio), xs)
+
+    def range(self):
+        return (min(1, self.ratio), max(1, self.ratio))
+
+
 class Shift(Shape):
     """Some other shape, additively shifted by some amount."""
 
@@ -48,6 +84,9 @@ class Shift(Shape):
     def compute(self, x):
         return self.shift + self.shape(x)
 
+    def compute_all(self, xs):
+        return self.shift + self.shape.compute_all(xs)
+
     def range(self):
         lo, hi = self.shape.range()
         return (self.shift+lo, self.shift+hi)
@@ -63,6 +102,9 @@ class Scale(Shape):
     def compute(self, x):
         return self.scale * self.shape(x)
 
+    def compute_all(self, xs):
+        return self.scale * self.shape.compute_all(xs)
+
     def range(self):
         lo, hi = self.shape.range()
         if self.scale < 0:
@@ -83,6 +125,14 @@ class Chain(Shape):
             return self.shape0(x / self.first_share)
         return self.shape1((x-self.first_share) / (1-self.first_share))
 
+    def compute_all(self, xs):
+        first = xs < self.first_share
+        rest = ~first
+        ys = np.empty_like(xs)
+        ys[first] = self.shape0.compute_all(xs[first] / self.first_share)
+        ys[rest] = self.shape1.compute_all((xs[rest]-self.first_share) / (1-self.first_share))
+        return ys
+
     def range(self):
         lo0, hi0 = self.shape0.range()
         lo1, hi1 = self.shape1.range()
@@ -105,6 +155,16 @@ def line(y0, y1):
     return Shift(Scale(LineShape(), y1-y0), y0)
 
 
+def exp(y0, y1):
+    """The shape of an exponential progression from y0 to y1."""
+
+    if y0 <= 0:
+        raise ValueError('y0 must be positive, was {}'.format(y0))
+    if y1 <= 0:
+        raise ValueError('y1 must be positive, was {}'.format(y1))
+    return Scale(ExponentialShape(y1/y0), y0)
+
+
 def triangle(y0, y1):
     """A symmetrical triangle from y0 to y1 and back."""
 
@@ -0,0 +1,179 @@
+import concurrent.futures
+import itertools
+import math
+import os
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from . import batches, loop, optimizer, sched
+
+
+SCHEDULES = {
+    'one_cycle': sched.one_cycle,
+    'stlr': sched.stlr,
+    'clr': sched.clr,
+}
+
+
+def run(
+    make_model, opt_fn, loss_fn, trn_dl, val_dl, configs, n_epochs,
+    metrics=None, n_procs=None, eta=None, min_epochs=1,
+):
+    """Train a model for each config in parallel, returning the results by val_loss.
+
+    Each config sets the base lr, the schedule by name from SCHEDULES, which
+    is one_cycle by default, and any keyword args for that schedule, e.g. as
+    produced by grid or sample. Every trial builds a fresh model by calling
+    make_model, so that and the loaders must be picklable.
+
+    Trials run in n_procs worker processes, by default one per core, and each
+    worker caps the torch threads to its share of the cores. With n_procs=0,
+    trials run one after another in this process instead.
+
+    If eta is given, trials are pruned by successive halving: all of them are
+    trained for min_epochs, then the best 1/eta of those for eta times longer,
+    and so on until the survivors are trained for n_epochs. Every rung trains
+    from scratch, so that each schedule spans the full run at that budget.
+    """
+
+    configs = list(configs)
+    if not configs:
+        return []
+    budgets = _budgets(n_epochs, eta, min_epochs)
+    n_procs = min(len(configs), os.cpu_count()) if n_procs is None else n_procs
+    results = []
+    with _pool(n_procs) as pool:
+        trials = list(range(len(configs)))
+        for rung, budget in enumerate(budgets):
+            args = [
+                (make_model, opt_fn, loss_fn, trn_dl, val_dl, configs[i], budget, metrics)
+                for i in trials
+            ]
+            losses = list(pool.map(_train, *zip(*args)))
+            for i, (val_loss, values) in zip(trials, losses):
+                results.append(_row(configs[i], i, rung, budget, val_loss, values, metrics))
+            if rung + 1 < len(budgets):
+                by_loss = sorted(zip(trials, losses), key=lambda trial: _nan_last(trial[1][0]))
+                trials = [i for i, _ in by_loss[:max(1, len(trials) // eta)]]
+    return sorted(results, key=lambda row: (-row['rung'], _nan_last(row['val_loss'])))
+
+
+def train(make_model, opt_fn, loss_fn, trn_dl, val_dl, config, n_epochs, metrics=None):
+    """Train a fresh model for the config, returning the final validation results."""
+
+    config = dict(config)
+    lr = config.pop('lr')
+    schedule_fn = SCHEDULES[config.pop('schedule', 'one_cycle')]
+    model = make_model()
+    optim = optimizer.make(opt_fn, model, lr)
+    schedule = schedule_fn(optim, n_epochs * len(trn_dl), **config)
+    mgr = batches.Manager(model, optim, loss_fn, schedule, metrics)
+    return loop.fit(mgr, trn_dl, val_dl, n_epochs, verbose=False)
+
+
+def grid(**choices):
+    """Every combination of the choices given for each keyword."""
+
+    keys = list(choices)
+    return [dict(zip(keys, vals)) for vals in itertools.product(*choices.values())]
+
+
+def sample(n, seed=None, **space):
+    """n random configs, drawing each keyword from its space.
+
+    A space is either a list to choose from, a function of a numpy RandomState
+    like uniform or log_uniform, or else a constant value.
+    """
+
+    rng = np.random.RandomState(seed)
+    return [{key: _draw(rng, vals) for key, vals in space.items()} for _ in range(n)]
+
+
+def uniform(low, high):
+    return lambda rng: float(rng.uniform(low, high))
+
+
+def log_uniform(low, high):
+    return lambda rng: float(math.exp(rng.uniform(math.log(low), math.log(high))))
+
+
+def show(results, decimals=6):
+    """Print the results as a table, with a column for every config keyword."""
+
+    keys = list(dict.fromkeys(key for row in results for key in row))
+    loop._print_wide(keys)
+    for row in results:
+        loop._print_wide([
+            np.round(row[key], decimals) if isinstance(row.get(key), float) else row.get(key, '')
+            for key in keys
+        ])
+
+
+def _budgets(n_epochs, eta, min_epochs):
+    if eta is None:
+        return [n_epochs]
+    if not isinstance(eta, int) or eta < 2:
+        raise ValueError(f'eta must be an integer of at least 2, was {eta}')
+    if not 1 <= min_epochs <= n_epochs:
+        raise ValueError(f'min_epochs must be in [1, {n_epochs}], was {min_epochs}')
+    budgets = []
+    budget = min_epochs
+    while budget < n_epochs:
+        budgets.append(budget)
+        budget *= eta
+    return budgets + [n_epochs]
+
+
+def _train(*args):
+    val_loss, values = train(*args)
+    return float(val_loss), [float(value) for value in values]
+
+
+def _row(config, trial, rung, n_epochs, val_loss, values, metrics):
+    names = [fn.__name__ for fn in metrics or []]
+    row = {'trial': trial, 'rung': rung, 'epochs': n_epochs}
+    row.update(config)
+    row['val_loss'] = val_loss
+    row.update(zip(names, values))
+    return row
+
+
+def _nan_last(loss):
+    return math.inf if math.isnan(loss) else loss
+
+
+def _draw(rng, vals):
+    if isinstance(vals, list):
+        return vals[rng.randint(len(vals))]
+    if callable(vals):
+        return vals(rng)
+    return vals
+
+
+def _pool(n_procs):
+    if n_procs == 0:
+        return _InProcess()
+    return concurrent.futures.ProcessPoolExecutor(
+        n_procs,
+        mp_context=mp.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(max(1, os.cpu_count() // n_procs),),
+    )
+
+
+def _init_worker(n_threads):
+    torch.set_num_threads(n_threads)
+
+
+class _InProcess(object):
+    """Stand-in for a process pool, mapping in this process."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
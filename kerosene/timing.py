@@ -0,0 +1,124 @@
+import collections
+import contextlib
+import json
+import time
+import torch
+
+
+class PhaseTimer(object):
+    """Record wall-clock time spent in each phase of training, e.g. backward.
+
+    Durations are aggregated into totals and log2 histograms of microseconds,
+    which end_epoch saves into history before starting afresh.
+
+    If trace is set, every span is also kept for export as a Chrome trace.
+    If profile is set, phases are also marked as torch.profiler ranges.
+    """
+
+    def __init__(self, trace=False, profile=False):
+        self.trace = trace
+        self.profile = profile
+        self.events = []
+        self.history = []
+        self._origin = time.perf_counter()
+        self._reset()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        profiled = torch.profiler.record_function(name) if self.profile else None
+        if profiled is not None:
+            profiled.__enter__()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+            if profiled is not None:
+                profiled.__exit__(None, None, None)
+
+    def iterate(self, it, name):
+        """Iterate over it, timing each call to next as the named phase."""
+        it = iter(it)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.record(name, start, time.perf_counter())
+            yield item
+
+    def record(self, name, start, end):
+        secs = end - start
+        self.totals[name] += secs
+        self.counts[name] += 1
+        self.histograms[name][int(secs * 1e6).bit_length()] += 1
+        if self.trace:
+            self.events.append((name, start, secs))
+
+    def summary(self):
+        """Per phase: the total seconds, the count, and the histogram.
+
+        Histogram bucket k counts durations within [2^(k-1), 2^k) microseconds.
+        """
+        return {
+            name: {
+                'secs': self.totals[name],
+                'count': self.counts[name],
+                'histogram': dict(sorted(self.histograms[name].items())),
+            }
+            for name in self.totals
+        }
+
+    def breakdown(self):
+        """A compact description of the share of time taken by each phase."""
+        total = sum(self.totals.values()) or 1
+        return ' '.join(f'{name}:{secs/total:.0%}' for name, secs in self.totals.items())
+
+    def end_epoch(self):
+        summary = self.summary()
+        self.history.append(summary)
+        self._reset()
+        return summary
+
+    def export_trace(self, path):
+        """Write the traced spans as JSON for chrome://tracing or Perfetto."""
+        events = [
+            {
+                'name': name,
+                'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': secs * 1e6,
+                'pid': 0,
+                'tid': 0,
+            }
+            for name, start, secs in self.events
+        ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events}, f)
+
+    def _reset(self):
+        self.totals = collections.defaultdict(float)
+        self.counts = collections.Counter()
+        self.histograms = collections.defaultdict(collections.Counter)
+
+
+class NoTimer(object):
+    """A stand-in for PhaseTimer that records nothing, as cheaply as possible."""
+
+    def phase(self, name):
+        return _NO_PHASE
+
+    def iterate(self, it, name):
+        return it
+
+    def breakdown(self):
+        return None
+
+    def end_epoch(self):
+        return None
+
+
+_NO_PHASE = contextlib.nullcontext()
+
+NO_TIMER = NoTimer()
@@ -2,44 +2,183 @@ import contextlib
 import numpy as np
 import torch
 
-from distutils.version import LooseVersion
 from torch.autograd import Variable
 
 from . import util
 
 
-IS_TORCH_04 = LooseVersion(torch.__version__) >= LooseVersion('0.4')
-USE_GPU = torch.cuda.is_available()
+HAS_FOREACH_MUL = hasattr(torch, '_foreach_mul_')
+HAS_FOREACH_ZERO = hasattr(torch, '_foreach_zero_')
+
+
+def __getattr__(name):
+    if name in _FLAGS:
+        return _flag(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def _flag(name):
+    """Compute IS_TORCH_04 and USE_GPU on first use, rather than at import."""
+    flags = globals()
+    if name not in flags:
+        flags[name] = _FLAGS[name]()
+    return flags[name]
+
+
+def _torch_version():
+    return tuple(int(part) for part in torch.__version__.split('+')[0].split('.')[:2])
+
+
+_FLAGS = {
+    'IS_TORCH_04': lambda: _torch_version() >= (0, 4),
+    'USE_GPU': lambda: torch.cuda.is_available(),
+}
 
 
 def to_gpu(x, *args, **kwargs):
-    return x.cuda(*args, **kwargs) if USE_GPU else x
+    return x.cuda(*args, **kwargs) if _flag('USE_GPU') else x
 
 
-def variable(x, requires_grad=False):
+def variable(x, requires_grad=False, pin=False, cast=True):
     if type(x) == Variable:
         return x
     if util.is_listy(x):
-        return [variable(o, requires_grad) for o in x]
-    return Variable(tensor(x), requires_grad=requires_grad)
+        return [variable(o, requires_grad, pin, cast) for o in x]
+    return Variable(tensor(x, pin=pin, cast=cast), requires_grad=requires_grad)
+
+
+def variable_batch(batch, pin=False):
+    """Inputs and targets from a batch of them, as a list of variables and a variable."""
+    *x, y = batch
+    return variable(x, pin=pin), variable(y, pin=pin)
+
+
+def variable_inputs(batch, pin=False):
+    """A list of variables from a batch of inputs without targets, or a single input."""
+    return variable(list(util.listify(batch)), pin=pin)
+
+
+def batch_size(xs, seq_first=False):
+    """The number of examples in inputs, along the second axis if seq_first."""
+    x0 = xs[0] if util.is_listy(xs) else xs
+    return x0.shape[1 if seq_first else 0]
+
+
+def materialize(x):
+    """x as a python number, copied back from the device if it is a tensor."""
+    return x.item() if torch.is_tensor(x) else x
+
+
+def tensor(x, cuda=True, pin=False, cast=True):
+    """Convert x to a tensor on the device, casting only after the copy.
+
+    That way narrow inputs like int32 indices move as few bytes as possible.
+    """
+
+    cast = cast and not torch.is_tensor(x)
+    x = create_tensor(x, cast=False)
+    if cuda and _flag('USE_GPU'):
+        if pin and not x.is_cuda:
+            x = x.pin_memory()
+        x = to_gpu(x, non_blocking=True)
+    return _cast(x) if cast else x
 
 
-def tensor(x, cuda=True):
-    x = create_tensor(x)
-    return to_gpu(x, async=True) if cuda else x
+# Widen integers to int64 and narrow doubles to float32, as PyTorch expects.
+_CASTS = {
+    torch.int8: torch.int64,
+    torch.int16: torch.int64,
+    torch.int32: torch.int64,
+    torch.float64: torch.float32,
+}
 
+_DTYPES = {
+    np.dtype(dtype) for dtype in (
+        np.bool_, np.uint8, np.int8, np.int16, np.int32, np.int64,
+        np.float16, np.float32, np.float64,
+    )
+}
+
+
+def create_tensor(x, cast=True):
+    """Convert x to a tensor, sharing memory with x whenever possible.
+
+    Anything supporting the buffer protocol works, e.g. arrays and memoryviews.
+    If cast is False, dtypes are preserved as-is instead of using _CASTS.
+    """
 
-def create_tensor(x):
     if torch.is_tensor(x):
         return x
 
-    x = np.ascontiguousarray(x)
-    if x.dtype in (np.int8, np.int16, np.int32, np.int64):
-        return torch.LongTensor(x.astype(np.int64))
-    if x.dtype in (np.float32, np.float64):
-        return torch.FloatTensor(x)
-    raise NotImplementedError(x.dtype)
+    x = np.asarray(x)
+    if x.dtype.newbyteorder('=') not in _DTYPES:
+        raise NotImplementedError(x.dtype)
+    if not x.dtype.isnative:
+        x = x.astype(x.dtype.newbyteorder('='))
+    if not x.flags.writeable:
+        x = x.copy()
+    x = torch.from_numpy(np.ascontiguousarray(x))
+    return _cast(x) if cast else x
+
+
+def _cast(x):
+    dtype = _CASTS.get(x.dtype)
+    return x if dtype is None else x.to(dtype)
 
 
 def no_grad():
-    return torch.no_grad() if IS_TORCH_04 else contextlib.suppress()
+    return torch.no_grad() if _flag('IS_TORCH_04') else contextlib.suppress()
+
+
+def inference_mode():
+    return torch.inference_mode() if hasattr(torch, 'inference_mode') else no_grad()
+
+
+def autocast(dtype):
+    """Run ops in dtype where it is safe to do so, or a no-op for None."""
+    if dtype is None or not hasattr(torch, 'autocast'):
+        return contextlib.suppress()
+    return torch.autocast('cuda' if _flag('USE_GPU') else 'cpu', dtype=dtype)
+
+
+def grad_scaler():
+    """A dynamic loss scaler for float16 training on the default device."""
+    device = 'cuda' if _flag('USE_GPU') else 'cpu'
+    if hasattr(torch, 'amp') and hasattr(torch.amp, 'GradScaler'):
+        return torch.amp.GradScaler(device)
+    if _flag('USE_GPU'):
+        return torch.cuda.amp.GradScaler()
+    raise NotImplementedError('float16 loss scaling on CPU needs a newer PyTorch')
+
+
+def compile(fn, **kwargs):
+    """Compile fn with torch.compile, or leave it as-is if unavailable."""
+    return torch.compile(fn, **kwargs) if hasattr(torch, 'compile') else fn
+
+
+def mark_dynamic(x, dim):
+    """Hint to torch.compile that x varies in size along dim."""
+    if hasattr(torch, '_dynamo') and torch.is_tensor(x) and x.dim() > dim and x.shape[dim] > 1:
+        torch._dynamo.mark_dynamic(x, dim)
+
+
+def foreach_mul_(tensors, scalar):
+    """Multiply each tensor in place, in as few kernels as torch allows."""
+    if not tensors:
+        return
+    if HAS_FOREACH_MUL:
+        torch._foreach_mul_(tensors, scalar)
+    else:
+        for x in tensors:
+            x.mul_(scalar)
+
+
+def foreach_zero_(tensors):
+    """Zero each tensor in place, in as few kernels as torch allows."""
+    if not tensors:
+        return
+    if HAS_FOREACH_ZERO:
+        torch._foreach_zero_(tensors)
+    else:
+        for x in tensors:
+            x.zero_()
@@ -1,4 +1,6 @@
-import collections
+import collections.abc
+import queue
+import threading
 
 
 def is_listy(x):
@@ -6,7 +8,7 @@ def is_listy(x):
 
 
 def is_iter(x):
-    return isinstance(x, collections.Iterable)
+    return isinstance(x, collections.abc.Iterable)
 
 
 def listify(x):
@@ -23,3 +25,49 @@ def list_along(x, to_match):
     if len(x) != n:
         raise ValueError(f'x and to_match should be the same size, was {len(x)} and {n}')
     return x
+
+
+def prefetch(it, n):
+    """Iterate over it, with up to n items produced ahead on a background thread.
+
+    Any exception raised while producing is re-raised by the consumer, even
+    one like KeyboardInterrupt or SystemExit.
+    """
+
+    if n < 1:
+        raise ValueError(f'n must be at least 1, was {n}')
+    items = queue.Queue(maxsize=n)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in it:
+                if not put((True, item)):
+                    return
+        except BaseException as e:
+            put((False, e))
+        else:
+            put((False, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            ok, item = items.get()
+            if ok:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        stop.set()
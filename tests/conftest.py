@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import torch
+
+from kerosene import batches, optimizer, sched
+
+
+def linear_model(n_in=3, n_out=1, seed=0):
+    torch.manual_seed(seed)
+    return torch.nn.Linear(n_in, n_out)
+
+
+def manager(
+    model=None, layer_groups=None, opt_fn=torch.optim.SGD, lrs=1e-2, nb=10,
+    schedule_fn=sched.one_cycle, init=False, **kwargs
+):
+    """A manager for regression with mse, by default of a linear model."""
+    model = linear_model() if model is None else model
+    optim = optimizer.make(opt_fn, model if layer_groups is None else layer_groups, lrs)
+    mgr = batches.Manager(
+        model, optim, torch.nn.functional.mse_loss, schedule_fn(optim, nb), **kwargs)
+    if init:
+        mgr.init_training()
+    return mgr
+
+
+def regression_dl(n_batches, batch_sz=8, n_in=3, seed=0):
+    """Batches of float32 inputs, with targets summing them."""
+    rng = np.random.RandomState(seed)
+    dl = []
+    for _ in range(n_batches):
+        x = rng.rand(batch_sz, n_in).astype(np.float32)
+        dl.append((x, x.sum(axis=1, keepdims=True)))
+    return dl
+
+
+@pytest.fixture
+def make_model():
+    return linear_model
+
+
+@pytest.fixture
+def make_manager():
+    return manager
+
+
+@pytest.fixture
+def make_dl():
+    return regression_dl
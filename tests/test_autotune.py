@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+import torch
+
+from kerosene import autotune
+
+
+@pytest.fixture
+def mgr(make_manager):
+    return make_manager(nb=100)
+
+
+def make_batch():
+    rng = np.random.RandomState(0)
+    return autotune.sampler(
+        rng.rand(100, 3).astype(np.float32), rng.rand(100, 1).astype(np.float32), seed=0)
+
+
+class Hungry(torch.nn.Module):
+    """Asks for far too much memory on batches over max_batch_sz."""
+
+    def __init__(self, max_batch_sz):
+        super().__init__()
+        self.max_batch_sz = max_batch_sz
+
+    def forward(self, x):
+        if x.shape[0] > self.max_batch_sz:
+            torch.empty(2**50)
+        return x
+
+
+def test_sampler():
+    make = autotune.sampler(np.arange(10), np.arange(10) * 2, seed=0)
+    x, y = make(4)
+    assert len(x) == 4
+    assert list(y) == list(x * 2)
+
+
+def test_probe_restores_state(mgr):
+    mgr.init_training()
+    weights = [p.detach().clone() for p in mgr.model.parameters()]
+
+    results = autotune.probe(mgr, make_batch(), [2, 8, 32], n_steps=2)
+    assert [row['batch_sz'] for row in results] == [2, 8, 32]
+    assert all(row['samples_per_sec'] > 0 for row in results)
+    assert all(row['peak_memory'] > 0 for row in results)
+
+    assert mgr.schedule.nb == 100
+    assert mgr.schedule.iter == 0
+    for p, weight in zip(mgr.model.parameters(), weights):
+        assert torch.equal(p, weight)
+
+
+def test_probe_stops_over_memory(mgr):
+    results = autotune.probe(mgr, make_batch(), [2, 8, 32], n_steps=1, max_memory=1)
+    assert [row['batch_sz'] for row in results] == [2]
+
+
+def test_probe_stops_on_out_of_memory(make_model, make_manager):
+    model = torch.nn.Sequential(make_model(), Hungry(4))
+    mgr = make_manager(model)
+    results = autotune.probe(mgr, make_batch(), [2, 4, 8, 16], n_steps=1)
+    assert [row['batch_sz'] for row in results] == [2, 4]
+
+
+def test_probe_raises_other_errors(make_model, make_manager):
+    mgr = make_manager(torch.nn.Sequential(make_model(), torch.nn.Linear(2, 1)))
+    with pytest.raises(RuntimeError):
+        autotune.probe(mgr, make_batch(), [2], n_steps=1)
+
+
+def test_out_of_memory():
+    assert autotune._out_of_memory(MemoryError())
+    assert autotune._out_of_memory(torch.OutOfMemoryError('CUDA out of memory'))
+    with pytest.raises(RuntimeError) as e:
+        torch.empty(2**50)
+    assert autotune._out_of_memory(e.value)
+    assert not autotune._out_of_memory(RuntimeError('shape mismatch'))
+
+
+def test_choose():
+    results = [
+        {'batch_sz': 8, 'samples_per_sec': 100, 'peak_memory': 10},
+        {'batch_sz': 16, 'samples_per_sec': 300, 'peak_memory': 20},
+        {'batch_sz': 32, 'samples_per_sec': 200, 'peak_memory': 40},
+        {'batch_sz': 64, 'samples_per_sec': 400, 'peak_memory': 80},
+    ]
+    assert autotune.choose(results) == 64
+    assert autotune.choose(results, max_memory=50) == 16
+    with pytest.raises(ValueError):
+        autotune.choose(results, max_memory=5)
+
+
+def test_rescale(mgr):
+    autotune.rescale(mgr.schedule, 32, 128)
+    assert mgr.schedule.nb == 25
+    assert mgr.schedule.init_lrs == pytest.approx([4e-2])
+
+    autotune.rescale(mgr.schedule, 128, 32, lr_scaling='sqrt')
+    assert mgr.schedule.nb == 100
+    assert mgr.schedule.init_lrs == pytest.approx([2e-2])
+
+    with pytest.raises(ValueError):
+        autotune.rescale(mgr.schedule, 1, 2, lr_scaling='cubic')
+
+
+def test_tune(mgr):
+    best, results = autotune.tune(mgr, make_batch(), 8, n_steps=1)
+    assert [row['batch_sz'] for row in results] == [2, 4, 8, 16, 32, 64, 128]
+    assert best in (2, 4, 8, 16, 32, 64, 128)
+    assert mgr.schedule.nb == -(-100 * 8 // best)
+    mgr.init_training()
+    assert mgr.optim.get_lrs() == pytest.approx([1e-2 * best / 8 / 10])
+
+
+def test_expect_over():
+    row = {'batch_sz': 8, 'peak_memory': 30}
+    assert not autotune._expect_over(row, 16, 10, None)
+    assert not autotune._expect_over(row, 16, 10, 50)
+    assert autotune._expect_over(row, 32, 10, 50)
+    assert not autotune._expect_over(row, 32, None, 50)
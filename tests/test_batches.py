@@ -1,8 +1,10 @@
 import pytest
 
+import gc
 import numpy as np
+import torch
 
-from kerosene import batches
+from kerosene import batches, optimizer, sched
 
 
 def test_exponential_moving_average():
@@ -79,3 +81,355 @@ class MockManager(object):
 
     def step(self, xs, y, with_step):
         return xs, Var(0)
+
+
+def test_tracked_runner_sync_every():
+    mgr = TensorManager(sync_every=2)
+    runner = batches.TrackedRunner(mgr, False, [tensor_err], ema_window=1, sync_every=2)
+
+    assert runner.run(tensor([1]), tensor([2])) is None
+    assert runner.run(tensor([2, 4]), tensor([4, 4])) == 3
+    assert runner.run(tensor([3]), tensor([6])) is None
+
+    loss, metrics = runner.report()
+    assert type(loss) is float
+    assert loss == (1 + 3*2 + 3) / 4
+    assert metrics == [(0 + 2*1 + 0) / 4]
+
+
+def test_manager_sync_every(make_trainer):
+    model = torch.nn.Linear(2, 1)
+    mgr = batches.Manager(model, None, torch.nn.functional.mse_loss, sync_every=4)
+    runner = mgr.eval_runner()
+    xs, y = [torch.ones(3, 2)], torch.zeros(3, 1)
+
+    loss, _ = mgr.step(xs, y)
+    assert torch.is_tensor(loss)
+    assert [runner.run(xs, y) is None for _ in range(4)] == [True, True, True, False]
+
+    with pytest.raises(ValueError):
+        batches.Manager(model, None, torch.nn.functional.mse_loss, sync_every=0)
+
+
+def tensor_err(preds, y):
+    return (preds - y/2).abs().mean()
+
+
+def tensor(x):
+    return torch.tensor(x, dtype=torch.float)
+
+
+class TensorManager(object):
+    def __init__(self, sync_every):
+        self.seq_first = False
+        self.sync_every = sync_every
+
+    def step(self, xs, y, with_step):
+        return xs.mean(), y - xs
+
+
+@pytest.fixture
+def make_trainer(make_manager):
+    def make(lr=1/10, **kwargs):
+        mgr = make_manager(
+            lrs=lr, nb=100, schedule_fn=lambda optim, nb: sched.Schedule(optim, nb, {}),
+            init=True, **kwargs)
+        return mgr.model, mgr
+    return make
+
+
+def regression_batch(n, seed):
+    gen = torch.Generator().manual_seed(seed)
+    return [torch.randn(n, 3, generator=gen)], torch.randn(n, 1, generator=gen)
+
+
+def test_micro_batches_match_full_batch(make_trainer):
+    xs, y = regression_batch(7, 0)
+    full_model, full = make_trainer()
+    split_model, split = make_trainer(micro_batches=3)
+
+    full_loss, full_preds = full.step(xs, y, with_step=True)
+    split_loss, split_preds = split.step(xs, y, with_step=True)
+    assert split_loss == pytest.approx(full_loss)
+    assert torch.allclose(split_preds, full_preds.detach())
+    assert torch.allclose(split_model.weight, full_model.weight)
+    assert split.schedule.iter == 1
+
+
+class TinyLM(torch.nn.Module):
+    def __init__(self, vocab=7, flat=True):
+        super().__init__()
+        self.embed = torch.nn.Embedding(vocab, 4)
+        self.out = torch.nn.Linear(4, vocab)
+        self.flat = flat
+
+    def forward(self, x):
+        preds = self.out(self.embed(x))
+        return preds.view(-1, preds.shape[-1]) if self.flat else preds
+
+
+def lm_loss(preds, y):
+    return torch.nn.functional.cross_entropy(preds.reshape(-1, preds.shape[-1]), y.reshape(-1))
+
+
+@pytest.mark.parametrize('flat', [True, False])
+def test_micro_batches_for_seq_first(flat):
+    gen = torch.Generator().manual_seed(0)
+    x = torch.randint(7, (5, 6), generator=gen)
+    y = torch.randint(7, (5, 6), generator=gen)
+    y = y.view(-1) if flat else y
+
+    def make(micro_batches):
+        torch.manual_seed(0)
+        model = TinyLM(flat=flat)
+        optim = optimizer.make(torch.optim.SGD, model, 1/10)
+        return model, batches.Manager(
+            model, optim, lm_loss, seq_first=True, micro_batches=micro_batches)
+
+    full_model, full = make(1)
+    split_model, split = make(3)
+    full.init_training()
+    split.init_training()
+    full_loss, full_preds = full.step([x], y, with_step=True)
+    split_loss, split_preds = split.step([x], y, with_step=True)
+    assert split_loss == pytest.approx(full_loss)
+    assert torch.allclose(split_preds, full_preds.detach())
+    assert torch.allclose(split_model.out.weight, full_model.out.weight)
+
+
+def test_micro_batches_bad_seq_first_targets():
+    model = TinyLM()
+    optim = optimizer.make(torch.optim.SGD, model, 1/10)
+    mgr = batches.Manager(model, optim, lm_loss, seq_first=True, micro_batches=2)
+    mgr.init_training()
+    with pytest.raises(ValueError):
+        mgr.step([torch.zeros(5, 6, dtype=torch.long)], torch.zeros(6, dtype=torch.long))
+
+
+def test_accumulate_matches_full_batch(make_trainer):
+    xs0, y0 = regression_batch(4, 0)
+    xs1, y1 = regression_batch(2, 1)
+    full_model, full = make_trainer()
+    acc_model, acc = make_trainer(accumulate=2)
+
+    full.step([torch.cat([xs0[0], xs1[0]])], torch.cat([y0, y1]), with_step=True)
+    weight = acc_model.weight.detach().clone()
+    acc.step(xs0, y0, with_step=True)
+    assert torch.equal(acc_model.weight, weight)
+    assert acc.schedule.iter == 0
+
+    acc.step(xs1, y1, with_step=True)
+    assert torch.allclose(acc_model.weight, full_model.weight)
+    assert acc.schedule.iter == 1
+
+
+def test_flush_partial_accumulation(make_trainer):
+    xs, y = regression_batch(4, 0)
+    full_model, full = make_trainer()
+    acc_model, acc = make_trainer(accumulate=3)
+
+    full.step(xs, y, with_step=True)
+    acc.step(xs, y, with_step=True)
+    acc.flush()
+    assert torch.allclose(acc_model.weight, full_model.weight)
+    assert acc.schedule.iter == 1
+
+    acc.flush()
+    assert acc.schedule.iter == 1
+
+
+def test_bad_accumulation(make_trainer):
+    with pytest.raises(ValueError):
+        make_trainer(accumulate=0)
+
+    with pytest.raises(ValueError):
+        make_trainer(micro_batches=0)
+
+
+def test_bf16_autocast(make_trainer):
+    xs, y = regression_batch(4, 0)
+    model, mgr = make_trainer(precision='bf16')
+    weight = model.weight.detach().clone()
+
+    loss, preds = mgr.step(xs, y, with_step=True)
+    assert preds.dtype == torch.bfloat16
+    assert not torch.equal(model.weight, weight)
+    assert mgr.schedule.iter == 1
+
+
+def test_fp16_overflow_skips_step(make_trainer):
+    xs, y = regression_batch(4, 0)
+    model, mgr = make_trainer(precision='fp16')
+    weight = model.weight.detach().clone()
+
+    mgr.step(xs, y * float('inf'), with_step=True)
+    assert torch.equal(model.weight, weight)
+    assert mgr.schedule.iter == 0
+
+    mgr.step(xs, y, with_step=True)
+    assert not torch.equal(model.weight, weight)
+    assert mgr.schedule.iter == 1
+
+
+def test_bad_precision(make_trainer):
+    with pytest.raises(ValueError):
+        make_trainer(precision='fp8')
+
+
+def test_predict():
+    model = torch.nn.Sequential(torch.nn.Linear(3, 2), torch.nn.Dropout(1/2))
+    mgr = batches.Manager(model, None, None)
+    mgr.eval_mode()
+    assert not model[1].training
+
+    xs, _ = regression_batch(4, 0)
+    with torch.no_grad():
+        assert torch.equal(mgr.predict(xs), model(*xs))
+
+
+def test_compiled_forward(make_trainer):
+    eager_model, eager = make_trainer()
+    model, mgr = make_trainer(compile={'backend': 'eager'})
+    for n in (4, 4, 3):
+        xs, y = regression_batch(n, n)
+        eager_loss, _ = eager.step(xs, y, with_step=True)
+        loss, preds = mgr.step(xs, y, with_step=True)
+        assert loss == pytest.approx(eager_loss)
+        assert preds.shape == (n, 1)
+    assert torch.allclose(model.weight, eager_model.weight)
+
+
+def test_compile_fallback(monkeypatch, make_trainer):
+    monkeypatch.delattr(torch, 'compile')
+    model, mgr = make_trainer(compile=True)
+    xs, y = regression_batch(4, 0)
+    mgr.step(xs, y, with_step=True)
+    assert mgr._compiled == mgr._forward_loss
+
+
+def make_frozen_model():
+    bn = torch.nn.BatchNorm1d(3)
+    bn.trainable = True
+    drop = torch.nn.Dropout(1/2)
+    model = torch.nn.Sequential(torch.nn.Linear(3, 3), bn, torch.nn.Sequential(drop))
+    return model, bn, drop
+
+
+def test_train_mode_respects_freezing():
+    model, bn, drop = make_frozen_model()
+    mgr = batches.Manager(model, None, None)
+
+    mgr.train_mode()
+    assert all(module.training for module in model.modules())
+
+    bn.bn_freeze = True
+    drop.drop_freeze = True
+    mgr.train_mode()
+    assert model.training and model[0].training
+    assert not bn.training
+    assert not drop.training
+
+    mgr.eval_mode()
+    assert not any(module.training for module in model.modules())
+
+
+def test_train_mode_sees_new_modules():
+    model, bn, drop = make_frozen_model()
+    mgr = batches.Manager(model, None, None)
+    mgr.train_mode()
+    mgr.eval_mode()
+
+    extra = torch.nn.BatchNorm1d(3)
+    model[2].append(extra)
+    mgr.train_mode()
+    assert bn.training
+    assert not extra.training
+
+    extra.trainable = True
+    mgr.train_mode()
+    assert extra.training
+
+
+def test_train_mode_sees_replaced_modules():
+    model, bn, drop = make_frozen_model()
+    mgr = batches.Manager(model, None, None)
+    mgr.train_mode()
+
+    model[2][0] = torch.nn.BatchNorm1d(3)
+    mgr.train_mode()
+    assert bn.training
+    assert not model[2][0].training
+
+
+def test_train_mode_for_layer_lists():
+    model, bn, drop = make_frozen_model()
+    drop.drop_freeze = True
+    batches._set_train([model[0], [model[2]]])
+    assert model[0].training
+    assert not drop.training
+
+
+def test_keep_state():
+    model = torch.nn.Sequential(torch.nn.Linear(3, 3), torch.nn.Sequential(torch.nn.ReLU()))
+    model[1].hidden = torch.zeros(3)
+    mgr = batches.Manager(model, None, None)
+    mgr.train_mode()
+    hidden = model[1].hidden
+
+    with mgr.keep_state():
+        mgr.eval_mode()
+        model[1].hidden = torch.ones(3)
+    assert model[1].hidden is hidden
+    assert not model[1].training
+
+
+def test_mode_plan_is_cached(monkeypatch):
+    model, bn, drop = make_frozen_model()
+    mgr = batches.Manager(model, None, None)
+    walks = []
+    all_modules = batches._all_modules
+    monkeypatch.setattr(batches, '_all_modules', lambda model: walks.append(model) or all_modules(model))
+
+    mgr.train_mode()
+    mgr.eval_mode()
+    mgr.train_mode()
+    assert len(walks) == 1
+
+    model.append(torch.nn.ReLU())
+    mgr.eval_mode()
+    assert len(walks) == 2
+
+
+def test_registration_hook_only_while_managers_live():
+    mgr = batches.Manager(make_frozen_model()[0], None, None)
+    mgr.train_mode()
+    assert batches._registrations.handle is not None
+
+    del mgr
+    gc.collect()
+    assert batches._registrations.handle is None
+
+
+class NormEval(torch.nn.Module):
+    """Keeps its batchnorm in eval mode while training, like some backbones."""
+
+    def __init__(self):
+        super().__init__()
+        self.bn = torch.nn.BatchNorm1d(3)
+        self.bn.trainable = True
+
+    def train(self, mode=True):
+        super().train(mode)
+        self.bn.eval()
+        return self
+
+
+def test_train_mode_calls_overridden_train():
+    model = torch.nn.Sequential(torch.nn.Linear(3, 3), NormEval())
+    mgr = batches.Manager(model, None, None)
+    mgr.train_mode()
+    assert model[1].training
+    assert not model[1].bn.training
+
+    mgr.eval_mode()
+    assert not any(module.training for module in model.modules())
@@ -0,0 +1,24 @@
+import json
+
+from kerosene import bench
+
+
+def test_quick_run(tmp_path):
+    path = tmp_path / 'bench.json'
+    bench.main(['--quick', '--output', str(path)])
+    with open(path) as f:
+        results = json.load(f)
+
+    assert set(results) == {'meta', 'step', 'create_tensor', 'run_epoch'}
+    assert results['meta']['torch']
+    assert len(results['step']) == 3 * 3 * 2
+    assert len(results['create_tensor']) == 4 * 2
+    assert len(results['run_epoch']) == 2
+    for key, timing in [
+        ('step', 'secs_per_step'),
+        ('create_tensor', 'secs_per_call'),
+        ('create_tensor', 'bytes_per_sec'),
+        ('run_epoch', 'secs_per_batch'),
+        ('run_epoch', 'batches_per_sec'),
+    ]:
+        assert all(row[timing] > 0 for row in results[key])
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import torch
+
+from kerosene import bucketing, torch_util
+
+
+def make_lengths(n=1000, seed=0):
+    return np.random.RandomState(seed).randint(1, 100, size=n)
+
+
+def test_sampler_covers_everything():
+    lengths = make_lengths(105)
+    sampler = bucketing.BucketSampler(lengths, 10, chunk_batches=3, seed=0)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 11
+    assert sorted(np.concatenate(batches)) == list(range(105))
+
+
+def test_sampler_reduces_padding():
+    lengths = make_lengths()
+    bucketed = list(bucketing.BucketSampler(lengths, 32, seed=0))
+    shuffled = np.array_split(np.random.RandomState(0).permutation(len(lengths)), 32)
+    assert bucketing.padding_efficiency(lengths, bucketed) > 0.9
+    assert bucketing.padding_efficiency(lengths, shuffled) < 0.6
+
+
+def test_sampler_reshuffles():
+    sampler = bucketing.BucketSampler(make_lengths(), 32, seed=0)
+    first, second = list(sampler), list(sampler)
+    assert any(not np.array_equal(a, b) for a, b in zip(first, second))
+
+
+def test_sampler_without_shuffle():
+    sampler = bucketing.BucketSampler([1, 3, 2, 4], 2, chunk_batches=1, shuffle=False)
+    assert [list(batch) for batch in sampler] == [[1, 0], [3, 2]]
+
+
+def test_bad_sampler():
+    with pytest.raises(ValueError):
+        bucketing.BucketSampler([1], 0)
+    with pytest.raises(ValueError):
+        bucketing.BucketSampler([1], 1, chunk_batches=0)
+
+
+def test_pad():
+    padded = bucketing.pad([[1, 2, 3], [4]], pad_value=-1)
+    assert padded.shape == (3, 2)
+    assert padded.tolist() == [[1, 4], [2, -1], [3, -1]]
+
+
+def test_loader():
+    rng = np.random.RandomState(0)
+    xs = [rng.randint(1, 10, size=n) for n in make_lengths(100)]
+    ys = rng.randint(0, 2, size=100)
+    dl = bucketing.BucketLoader(xs, ys, 8, chunk_batches=4, seed=0)
+    assert len(dl) == 13
+
+    n_seen = 0
+    for x, y in dl:
+        assert x.ndim == 2
+        assert x.shape[1] == len(y)
+        n_seen += len(y)
+        assert torch_util.variable(x).dtype == torch.int64
+    assert n_seen == 100
+    assert 0.8 < dl.efficiency() <= 1
+    assert dl.efficiency() == pytest.approx(
+        sum(len(x) for x in xs) / dl.n_padded)
+
+
+def test_loader_pads_targets():
+    xs = [np.arange(n) for n in [2, 5, 3]]
+    dl = bucketing.BucketLoader(xs, xs, 3, shuffle=False, pad_targets=True, dtype=np.float32)
+    (x, y), = list(dl)
+    assert x.shape == y.shape == (5, 3)
+    assert x.dtype == np.float32
+    assert dl.efficiency() == pytest.approx(10 / 15)
+
+
+def test_loader_needs_matching_targets():
+    with pytest.raises(ValueError):
+        bucketing.BucketLoader([[1]], [1, 2], 1)
@@ -0,0 +1,109 @@
+import pytest
+
+import torch
+
+from kerosene import checkpoint, sched
+
+
+def train(mgr, runner, n_steps):
+    gen = torch.Generator().manual_seed(n_steps)
+    for _ in range(n_steps):
+        runner.run([torch.randn(4, 3, generator=gen)], torch.randn(4, 1, generator=gen))
+
+
+def test_snapshot_is_a_copy(make_manager):
+    mgr = make_manager(opt_fn=torch.optim.Adam, init=True)
+    state = checkpoint.snapshot(mgr)
+    with torch.no_grad():
+        mgr.model.weight.add_(1)
+    assert not torch.equal(state['model']['weight'], mgr.model.weight)
+
+
+def test_save_and_restore(tmp_path, make_model, make_manager):
+    mgr = make_manager(opt_fn=torch.optim.Adam, init=True)
+    runner = mgr.train_runner()
+    train(mgr, runner, 3)
+
+    ckpt = checkpoint.Checkpointer(str(tmp_path / 'ckpt.pt'), every=3)
+    assert not ckpt.exists()
+    for batch in range(1, 4):
+        ckpt.step(mgr, runner, 1, batch)
+    ckpt.wait()
+    assert ckpt.exists()
+
+    resumed = make_manager(make_model(seed=1), opt_fn=torch.optim.Adam)
+    state = ckpt.restore(resumed)
+    assert state['epoch'] == 1
+    assert state['batch'] == 3
+    assert resumed.schedule.iter == 3
+    assert list(resumed.optim.get_lrs()) == pytest.approx(list(mgr.optim.get_lrs()))
+    assert torch.equal(resumed.model.weight, mgr.model.weight)
+
+    resumed_runner = resumed.train_runner()
+    resumed_runner.load_state_dict(state['runner'])
+    assert resumed_runner.report() == runner.report()
+
+    train(mgr, runner, 2)
+    train(resumed, resumed_runner, 2)
+    assert torch.allclose(resumed.model.weight, mgr.model.weight)
+    assert resumed_runner.report() == pytest.approx(runner.report())
+
+
+def test_save_waits_for_optimizer_step(tmp_path, make_manager):
+    mgr = make_manager(accumulate=2, init=True)
+    runner = mgr.train_runner()
+    ckpt = checkpoint.Checkpointer(str(tmp_path / 'ckpt.pt'), every=3)
+    for batch in range(1, 5):
+        train(mgr, runner, 1)
+        ckpt.step(mgr, runner, 0, batch)
+        ckpt.wait()
+        assert ckpt.exists() == (batch == 4)
+
+    resumed = checkpoint.Checkpointer(ckpt.path, every=3)
+    state = resumed.restore(make_manager())
+    assert state['batch'] == 4
+    assert resumed.n_steps == 4
+    assert state['iter'] == 2
+
+
+def test_write_errors_are_raised(tmp_path, make_manager):
+    mgr = make_manager(init=True)
+    ckpt = checkpoint.Checkpointer(str(tmp_path / 'missing' / 'ckpt.pt'), every=1)
+    ckpt.step(mgr, mgr.train_runner(), 0, 1)
+    with pytest.raises((OSError, RuntimeError)):
+        ckpt.wait()
+
+
+def test_bad_interval():
+    with pytest.raises(ValueError):
+        checkpoint.Checkpointer('ckpt.pt', every=0)
+
+
+def test_rollback(make_manager, make_dl):
+    model = torch.nn.Sequential(torch.nn.Linear(3, 3), torch.nn.Dropout(), torch.nn.Linear(3, 1))
+    mgr = make_manager(model, init=True)
+    mgr.eval_mode()
+    model[1].train()
+    schedule = mgr.schedule
+    weights = [p.detach().clone() for p in model.parameters()]
+
+    with checkpoint.rollback(mgr, sched.nop()):
+        assert mgr.schedule is not schedule
+        assert all(module.training for module in model.modules())
+        x, y = make_dl(1)[0]
+        mgr.step([torch.from_numpy(x)], torch.from_numpy(y), with_step=True)
+        assert not torch.equal(model[0].weight, weights[0])
+
+    assert mgr.schedule is schedule
+    assert [module.training for module in model.modules()] == [False, False, True, False]
+    for p, weight in zip(model.parameters(), weights):
+        assert torch.equal(p, weight)
+
+
+def test_rollback_on_error(make_manager):
+    mgr = make_manager(init=True)
+    schedule = mgr.schedule
+    with pytest.raises(ZeroDivisionError):
+        with checkpoint.rollback(mgr, sched.nop()):
+            1 / 0
+    assert mgr.schedule is schedule
@@ -0,0 +1,118 @@
+import pytest
+
+import functools
+import math
+import socket
+import torch
+import torch.distributed as dist
+
+from kerosene import batches, checkpoint, distributed, metrics
+
+
+def test_shard():
+    dl = list(range(10))
+    assert list(distributed.Shard(dl, 0, 3)) == [0, 3, 6]
+    assert list(distributed.Shard(dl, 1, 3)) == [1, 4, 7]
+    assert list(distributed.Shard(dl, 2, 3)) == [2, 5, 8]
+    assert len(distributed.Shard(dl, 2, 3)) == 3
+    assert list(distributed.Shard(dl, 0, 1)) == dl
+
+
+def test_shard_without_drop_last():
+    dl = list(range(10))
+    shards = [distributed.Shard(dl, rank, 3, drop_last=False) for rank in range(3)]
+    assert [list(shard) for shard in shards] == [[0, 3, 6, 9], [1, 4, 7], [2, 5, 8]]
+    assert [len(shard) for shard in shards] == [4, 3, 3]
+
+
+def test_bad_shard():
+    with pytest.raises(ValueError):
+        distributed.Shard([], 3, 3)
+
+    with pytest.raises(ValueError):
+        distributed.Shard([], -1, 3)
+
+
+def test_all_reduce_averages(tmp_path):
+    dist.init_process_group('gloo', init_method=f'file://{tmp_path}/init', rank=0, world_size=1)
+    try:
+        loss, metric = batches.WeightedAverage(), batches.WeightedAverage()
+        loss.update(1, wt=1)
+        loss.update(4, wt=2)
+        metric.update(2, wt=4)
+        assert distributed.all_reduce_averages([loss, metric]) == [3, 2]
+    finally:
+        dist.destroy_process_group()
+
+
+def test_all_reduce_streaming_metrics(tmp_path):
+    dist.init_process_group('gloo', init_method=f'file://{tmp_path}/init', rank=0, world_size=1)
+    try:
+        loss, top1 = batches.WeightedAverage(), metrics.TopK(1)
+        loss.update(2, wt=3)
+        top1.update(torch.tensor([[1., 0], [1, 0]]), torch.tensor([0, 1]))
+        assert distributed.all_reduce_averages([top1, loss]) == [1/2, 2]
+        assert top1.value() == 1/2
+    finally:
+        dist.destroy_process_group()
+
+
+def test_prepare_scales_schedule(tmp_path, make_manager):
+    dist.init_process_group('gloo', init_method=f'file://{tmp_path}/init', rank=0, world_size=1)
+    try:
+        mgr = distributed.prepare(make_manager(nb=10), distributed.Shard(range(10), 0, 3), 2)
+        assert isinstance(mgr.model, torch.nn.parallel.DistributedDataParallel)
+        assert mgr.schedule.nb == 2 * 3
+        assert mgr.reduce is distributed.all_reduce_averages
+
+        mgr = distributed.prepare(make_manager(nb=10, accumulate=2), range(5), 4)
+        assert mgr.schedule.nb == 4 * 3
+    finally:
+        dist.destroy_process_group()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_fit(make_manager, make_dl):
+    make_mgr = functools.partial(make_manager, nb=2 * 5)
+    loss, values = distributed.fit(
+        make_mgr, make_dl(5), make_dl(3, seed=1), 2, n_procs=2,
+        master_port=free_port(), verbose=False)
+    assert math.isfinite(loss)
+    assert values == []
+
+
+def test_fit_with_accumulate(make_manager, make_dl):
+    make_mgr = functools.partial(make_manager, nb=4 * 10, accumulate=2)
+    loss, _ = distributed.fit(
+        make_mgr, make_dl(10), make_dl(3, seed=1), 4, n_procs=3,
+        master_port=free_port(), verbose=False)
+    assert math.isfinite(loss)
+
+
+def test_fit_with_checkpoint(tmp_path, make_manager, make_dl):
+    path = tmp_path / 'ckpt.pt'
+    make_mgr = functools.partial(make_manager, nb=2 * 4)
+    distributed.fit(
+        make_mgr, make_dl(4), make_dl(2, seed=1), 2, n_procs=2, master_port=free_port(),
+        verbose=False, checkpoint=checkpoint.Checkpointer(str(path), every=1))
+    assert [p.name for p in tmp_path.iterdir()] == ['ckpt.pt']
+    state = torch.load(path, weights_only=False)
+    assert (state['epoch'], state['batch']) == (1, 2)
+
+    loss, _ = distributed.fit(
+        make_mgr, make_dl(4), make_dl(2, seed=1), 2, n_procs=2, master_port=free_port(),
+        verbose=False, checkpoint=checkpoint.Checkpointer(str(path), every=1))
+    assert math.isfinite(loss)
+
+
+def test_fit_with_val_secs(make_manager, make_dl):
+    make_mgr = functools.partial(make_manager, nb=2 * 6)
+    loss, _ = distributed.fit(
+        make_mgr, make_dl(6), make_dl(3, seed=1), 2, n_procs=2,
+        master_port=free_port(), verbose=False, val_secs=1e-3)
+    assert math.isfinite(loss)
@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+from kerosene import interactive
+
+
+def test_progress_log_throttles():
+    out = io.StringIO()
+    calls = []
+
+    def values():
+        calls.append(1)
+        return {'loss': 0.5}
+
+    progress = interactive.Progress(10, mode='log', interval=3600, desc='trn', file=out)
+    for _ in range(10):
+        progress.update(values=values)
+    assert out.getvalue() == ''
+    assert calls == []
+
+    progress.close(values=values)
+    line, = out.getvalue().splitlines()
+    assert line.startswith('trn 10/10 (100%)')
+    assert line.endswith('loss=0.5')
+    assert len(calls) == 1
+
+
+def test_progress_log_every_update():
+    out = io.StringIO()
+    progress = interactive.Progress(3, mode='log', interval=0, file=out)
+    for _ in range(3):
+        progress.update()
+    progress.close()
+    assert len(out.getvalue().splitlines()) == 3
+
+
+def test_progress_silent():
+    progress = interactive.Progress(5, mode=False)
+    for _ in range(5):
+        progress.update(values=lambda: pytest.fail('values should not be computed'))
+    progress.close()
+    assert progress.n == 5
+
+
+def test_progress_mode():
+    assert interactive.Progress(1, mode=None).mode == 'silent'
+    with pytest.raises(ValueError):
+        interactive.Progress(1, mode='loud')
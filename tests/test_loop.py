@@ -0,0 +1,253 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import torch
+import torch.distributed as dist
+
+from kerosene import batches, interactive, loop, timing
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import numpy, torch
+middle = time.perf_counter()
+import kerosene.loop
+end = time.perf_counter()
+heavy = [name for name in ('ipykernel', 'tqdm.notebook') if name in sys.modules]
+print(middle - start, end - middle, ','.join(heavy))
+'''
+
+
+def test_import_is_light():
+    out = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT], cwd=ROOT,
+        check=True, capture_output=True, text=True).stdout.split()
+    assert len(out) == 2, f'imported {out[2]}'
+    assert float(out[1]) < 1
+
+
+def test_run_epoch_silent(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=5, init=True)
+    loss, metrics = loop.run_epoch(mgr.train_runner(), make_dl(5), track_progress=False)
+    assert loss > 0
+    assert metrics == []
+    assert capsys.readouterr().out == ''
+
+
+def test_run_epoch_log(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=5, init=True)
+    done = []
+    loop.run_epoch(
+        mgr.train_runner(), make_dl(5), track_progress='log', progress_secs=0,
+        on_batch=done.append)
+    assert done == [1, 2, 3, 4, 5]
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 5
+    assert lines[-1].startswith('5/5 (100%)')
+    assert 'loss=' in lines[-1]
+
+
+def inputs(make_dl, n_batches, batch_sz=4):
+    return [x for x, _ in make_dl(n_batches, batch_sz=batch_sz)]
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_predict_into(make_manager, make_dl, prefetch):
+    mgr = make_manager()
+    dl = inputs(make_dl, 3) + [inputs(make_dl, 1, batch_sz=2)[0]]
+    out = np.full((20, 1), -1, dtype=np.float32)
+
+    assert loop.predict_into(mgr, dl, out, prefetch=prefetch) == 14
+    with torch.no_grad():
+        expected = mgr.model(torch.from_numpy(np.concatenate(dl))).numpy()
+    assert np.allclose(out[:14], expected)
+    assert (out[14:] == -1).all()
+    assert not mgr.model.training
+
+
+def test_predict_streams_batches(make_manager, make_dl):
+    mgr = make_manager()
+    preds = loop.predict(mgr, inputs(make_dl, 3), prefetch=1)
+    assert [p.shape for p in preds] == [(4, 1)] * 3
+
+
+class Sum(torch.nn.Module):
+    def forward(self, x0, x1):
+        return x0 + x1
+
+
+def test_predict_tuple_batches():
+    mgr = batches.Manager(Sum(), None, None)
+    x0, x1 = np.ones((3, 2), dtype=np.float32), np.arange(6, dtype=np.float32).reshape(3, 2)
+    dl = [(x0, x1), (x0[:1], x1[:1])]
+    out = np.zeros((4, 2), dtype=np.float32)
+    assert loop.predict_into(mgr, dl, out) == 4
+    assert out.tolist() == (x0 + x1).tolist() + (x0 + x1)[:1].tolist()
+
+
+class SeqFirst(torch.nn.Module):
+    def forward(self, x):
+        return x * 2
+
+
+def test_predict_into_seq_first():
+    mgr = batches.Manager(SeqFirst(), None, None, seq_first=True)
+    dl = [np.ones((5, 3), dtype=np.float32), np.full((5, 2), 2, dtype=np.float32)]
+    out = np.zeros((5, 5), dtype=np.float32)
+    assert loop.predict_into(mgr, dl, out, prefetch=1) == 5
+    assert (out[:, :3] == 2).all()
+    assert (out[:, 3:] == 4).all()
+
+
+class Recording(torch.nn.Module):
+    """A linear model recording the id of each batch it evaluates, and its state.
+
+    The state counts the batches since the last reset, which is recorded for
+    each training batch and at every reset.
+    """
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.linear = torch.nn.Linear(3, 1)
+        self.seen = []
+        self.trained = []
+        self.resets = []
+        self.state = 0
+
+    def forward(self, x):
+        if self.training:
+            self.trained.append(self.state)
+        else:
+            self.seen.append(int(x[0, 0]))
+        self.state += 1
+        return self.linear(x)
+
+    def reset(self):
+        self.resets.append(self.state)
+        self.state = 0
+
+
+def id_dl(n_batches):
+    return [
+        (np.full((2, 3), i, dtype=np.float32), np.zeros((2, 1), dtype=np.float32))
+        for i in range(n_batches)
+    ]
+
+
+def fit_rows(capsys, mgr, trn_dl, val_dl, n_epochs, **kwargs):
+    result = loop.fit(mgr, trn_dl, val_dl, n_epochs, progress=False, **kwargs)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[:3] == ['epoch', 'trn_loss', 'val_loss']
+    return result, [line.split() for line in lines[1:]]
+
+
+def test_fit_every_epoch(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=2 * 6)
+    (loss, metrics), rows = fit_rows(capsys, mgr, make_dl(6), make_dl(2, seed=1), 2)
+    assert [row[0] for row in rows] == ['0', '1']
+    assert float(rows[-1][2]) == pytest.approx(loss, abs=1e-6)
+    assert metrics == []
+
+
+def test_fit_val_every(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=2 * 6)
+    (loss, _), rows = fit_rows(capsys, mgr, make_dl(6), make_dl(2, seed=1), 2, val_every=4)
+    assert [row[0] for row in rows] == ['0.67', '1.33', '2.00', 'final']
+    assert float(rows[-1][2]) == pytest.approx(loss, abs=1e-6)
+
+
+def test_fit_val_secs(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=3)
+    _, rows = fit_rows(capsys, mgr, make_dl(3), make_dl(2, seed=1), 1, val_secs=0)
+    assert [row[0] for row in rows] == ['0.33', '0.67', '1.00', 'final']
+
+
+@pytest.mark.parametrize('rotate, seen', [
+    (False, [0, 1, 0, 1, 0, 1, 2]),
+    (True, [0, 1, 2, 0, 0, 1, 2]),
+])
+def test_fit_val_batches(capsys, make_manager, make_dl, rotate, seen):
+    model = Recording()
+    mgr = make_manager(model, nb=2 * 2)
+    _, rows = fit_rows(
+        capsys, mgr, make_dl(2), id_dl(3), 2, val_batches=2, val_rotate=rotate)
+    assert [row[0] for row in rows] == ['0*', '1*', 'final']
+    assert model.seen == seen
+
+
+def test_fit_val_every_keeps_model_state(capsys, make_manager, make_dl):
+    model = Recording()
+    mgr = make_manager(model, nb=2 * 6)
+    fit_rows(capsys, mgr, make_dl(6), id_dl(2), 2, val_every=3)
+    assert model.trained == 2 * list(range(6))
+    assert model.resets == [0, 3, 6, 6, 3, 6, 6]
+
+
+def test_fit_val_every_with_breakdown(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=4, timer=timing.PhaseTimer())
+    loop.fit(mgr, make_dl(4), make_dl(2, seed=1), 1, val_every=2, progress=False)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[-1] == 'breakdown'
+    assert all('forward:' in line for line in lines[1:3])
+
+
+def test_fit_silent_progress(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=2 * 3)
+    loop.fit(mgr, make_dl(3), make_dl(2, seed=1), 2, progress='silent')
+    out, err = capsys.readouterr()
+    assert err == ''
+    assert [line.split()[0] for line in out.splitlines()] == ['epoch', '0', '1']
+
+
+def test_fit_log_progress(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=2 * 3)
+    loop.fit(mgr, make_dl(3), make_dl(2, seed=1), 2, progress='log')
+    out, err = capsys.readouterr()
+    assert err == ''
+    [epochs] = [line for line in out.splitlines() if line.startswith('Epoch')]
+    assert epochs.startswith('Epoch 2/2 (100%)')
+
+
+def test_first_rank_decides(tmp_path):
+    assert loop._first_rank_decides(True)
+    dist.init_process_group('gloo', init_method=f'file://{tmp_path}/init', rank=0, world_size=1)
+    try:
+        assert loop._first_rank_decides(True)
+        assert not loop._first_rank_decides(False)
+    finally:
+        dist.destroy_process_group()
+
+
+def test_fit_progress_secs(capsys, make_manager, make_dl):
+    mgr = make_manager(nb=2 * 3)
+    loop.fit(mgr, make_dl(3), make_dl(2, seed=1), 2, progress='log', progress_secs=0)
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in lines if '/3 (' in line] == ['1/3', '2/3', '3/3'] * 2
+
+
+def test_fit_clears_bars_once(monkeypatch, make_manager, make_dl):
+    clears = []
+    monkeypatch.setattr(interactive, 'in_notebook', lambda: True)
+    monkeypatch.setattr(interactive, 'clear_tqdm', lambda: clears.append(1))
+    monkeypatch.setattr(loop, 'in_notebook', lambda: True)
+    monkeypatch.setattr(loop, 'clear_tqdm', lambda: clears.append(1))
+    mgr = make_manager(nb=2 * 3)
+    loop.fit(mgr, make_dl(3), make_dl(2, seed=1), 2, progress='bar')
+    assert clears == [1]
+
+
+def test_variables():
+    dl = [(np.zeros((2, 3)), np.ones((2, 1), dtype=np.int32))] * 3
+    for prefetch in (0, 2):
+        converted = list(loop.variables(dl, prefetch))
+        assert len(converted) == 3
+        for xs, y in converted:
+            assert [x.dtype for x in xs] == [torch.float32]
+            assert y.dtype == torch.int64
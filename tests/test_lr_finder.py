@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import torch
+
+from kerosene import lr_finder
+
+
+@pytest.fixture
+def mgr(make_manager):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.Linear(4, 1))
+    return make_manager(model, [model[0], model[1]], lrs=[1e-3, 1e-2])
+
+
+def test_find(mgr, make_dl):
+    mgr.init_training()
+    weights = [p.detach().clone() for p in mgr.model.parameters()]
+
+    suggested, lrs, losses = lr_finder.find(mgr, make_dl(10), n_steps=50, end_lr=100)
+    assert len(lrs) == len(losses) <= 50
+    assert lrs[0] == pytest.approx([1e-8, 1e-7])
+    assert np.all(np.diff(lrs[:, 1]) > 0)
+    assert len(losses) < 50 or not np.isfinite(losses[-1])
+    assert suggested[1] == pytest.approx(10 * suggested[0])
+    assert 1e-8 < suggested[1] < 100
+
+    assert mgr.schedule.nb == 10
+    assert mgr.optim.get_lrs() == pytest.approx([1e-4, 1e-3])
+    for p, weight in zip(mgr.model.parameters(), weights):
+        assert torch.equal(p, weight)
+
+
+def test_find_without_divergence(mgr, make_dl):
+    suggested, lrs, losses = lr_finder.find(mgr, make_dl(3), n_steps=8, end_lr=1e-3)
+    assert len(lrs) == 8
+    assert lrs[-1, 1] == pytest.approx(1e-3 * (1e-7 / 1e-3) ** (1/8))
+    assert len(suggested) == 2
+
+
+def test_find_with_accumulation(mgr, make_dl):
+    mgr.accumulate = 2
+    mgr._weighted = True
+    _, lrs, _ = lr_finder.find(mgr, make_dl(3), n_steps=4, end_lr=1e-3)
+    assert len(lrs) == 8
+    assert mgr._pending_batches == 0
+
+
+def test_find_bad_args(mgr, make_dl):
+    with pytest.raises(ValueError):
+        lr_finder.find(mgr, make_dl(1), n_steps=0)
+    with pytest.raises(ValueError):
+        lr_finder.find(mgr, make_dl(1), start_lr=1, end_lr=1e-1)
+    with pytest.raises(ValueError):
+        lr_finder.find(mgr, [])
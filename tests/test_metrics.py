@@ -0,0 +1,136 @@
+import pytest
+
+import itertools
+import torch
+
+from kerosene import batches, metrics
+
+
+def exact_auc(scores, y):
+    pos = [s for s, t in zip(scores, y) if t == 1]
+    neg = [s for s, t in zip(scores, y) if t == 0]
+    wins = sum(1 if p > n else 1/2 if p == n else 0 for p, n in itertools.product(pos, neg))
+    return wins / (len(pos) * len(neg))
+
+
+def test_auc():
+    gen = torch.Generator().manual_seed(0)
+    y = torch.randint(0, 2, (500,), generator=gen)
+    scores = (y + torch.randn(500, generator=gen)).sigmoid()
+
+    auc = metrics.AUC(n_bins=10000)
+    for chunk, chunk_y in zip(scores.split(64), y.split(64)):
+        auc.update(chunk, chunk_y)
+    assert auc.value() == pytest.approx(exact_auc(scores.tolist(), y.tolist()), abs=1e-3)
+
+
+def test_auc_from_logits():
+    auc = metrics.AUC(n_bins=4, from_logits=True)
+    auc.update(torch.tensor([[-5.], [5.], [-5.], [5.]]), torch.tensor([0, 1, 0, 1]))
+    assert auc.value() == 1
+    auc.update(torch.tensor([5.]), torch.tensor([0]))
+    assert auc.value() == pytest.approx(5/6)
+
+
+def test_confusion_metrics():
+    y = torch.tensor([0, 0, 1, 1, 2, 2])
+    preds = torch.eye(3)[torch.tensor([0, 1, 1, 1, 2, 0])]
+
+    precision = metrics.Precision(3)
+    recall = metrics.Recall(3)
+    f1 = metrics.F1(3)
+    micro = metrics.F1(3, average='micro')
+    for metric in (precision, recall, f1, micro):
+        metric.update(preds, y)
+
+    assert precision.value() == pytest.approx((1/2 + 2/3 + 1) / 3)
+    assert recall.value() == pytest.approx((1/2 + 1 + 1/2) / 3)
+    assert f1.value() == pytest.approx((1/2 + 4/5 + 2/3) / 3)
+    assert micro.value() == pytest.approx(4/6)
+
+
+def test_binary_thresholds():
+    f1 = metrics.F1(average='binary', threshold=0.5)
+    f1.update(torch.tensor([0.1, 0.7, 0.6, 0.2]), torch.tensor([0, 1, 0, 1]))
+    assert f1.value() == pytest.approx(2 / (2 + 1 + 1))
+
+
+def test_bad_average():
+    with pytest.raises(ValueError):
+        metrics.F1(average='weighted')
+
+
+def test_top_k():
+    preds = torch.tensor([[3., 2, 1], [1, 2, 3], [2, 3, 1]])
+    y = torch.tensor([0, 1, 2])
+
+    top1, top2 = metrics.TopK(1), metrics.TopK(2)
+    top1.update(preds, y)
+    top2.update(preds, y)
+    assert top1.value() == 1/3
+    assert top2.value() == 2/3
+
+
+def test_merge_and_fresh():
+    gen = torch.Generator().manual_seed(0)
+    y = torch.randint(0, 3, (40,), generator=gen)
+    preds = torch.randn(40, 3, generator=gen)
+
+    whole, first = metrics.F1(3), metrics.F1(3)
+    whole.update(preds, y)
+    first.update(preds[:25], y[:25])
+    second = first.fresh()
+    assert second.state.sum() == 0
+    second.update(preds[25:], y[25:])
+    assert first.merge(second).value() == whole.value()
+
+
+def test_tracked_runner_with_streaming_metrics():
+    model = torch.nn.Linear(2, 3)
+    mgr = batches.Manager(model, None, torch.nn.functional.cross_entropy, metrics=[metrics.TopK(1)])
+    runner = mgr.eval_runner()
+    gen = torch.Generator().manual_seed(0)
+    xs, y = [torch.randn(10, 2, generator=gen)], torch.randint(0, 3, (10,), generator=gen)
+    with torch.no_grad():
+        runner.run(xs, y)
+        runner.run(xs, y)
+        hits = (model(*xs).argmax(-1) == y).float().mean().item()
+
+    _, [top1] = runner.report()
+    assert top1 == pytest.approx(hits)
+    assert mgr.metrics[0].state.sum() == 0
+
+
+def test_confusion_matrix_is_abstract():
+    with pytest.raises(TypeError):
+        metrics.ConfusionMatrix('confusion', 3)
+
+
+def test_state_dict():
+    preds, y = torch.tensor([[3., 2, 1], [1, 2, 3]]), torch.tensor([0, 1])
+    top1 = metrics.TopK(1)
+    top1.update(preds, y)
+    state = top1.state_dict()
+    top1.update(preds, y)
+    assert state['state'].tolist() == [1, 2]
+
+    restored = metrics.TopK(1)
+    restored.load_state_dict(state)
+    restored.update(preds, y)
+    assert restored.state.tolist() == [2, 4]
+    assert state['state'].tolist() == [1, 2]
+
+
+def test_tracked_runner_state_dict_with_streaming_metrics():
+    model = torch.nn.Linear(2, 3)
+    mgr = batches.Manager(model, None, torch.nn.functional.cross_entropy, metrics=[metrics.F1(3)])
+    gen = torch.Generator().manual_seed(0)
+    xs, y = [torch.randn(10, 2, generator=gen)], torch.randint(0, 3, (10,), generator=gen)
+    runner = mgr.eval_runner()
+    with torch.no_grad():
+        runner.run(xs, y)
+    state = runner.state_dict()
+
+    restored = mgr.eval_runner()
+    restored.load_state_dict(state)
+    assert restored.report() == runner.report()
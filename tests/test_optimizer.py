@@ -1,8 +1,9 @@
 import pytest
 
 import collections
+import torch
 
-from kerosene import optimizer
+from kerosene import optimizer, torch_util
 
 
 class MockOptimizer(object):
@@ -40,3 +41,174 @@ def test_failure_on_bad_parameter_lengths():
 
     with pytest.raises(ValueError):
         optim.set_momentums([3, 4])
+
+
+def make_sgd(lr, wd):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.Linear(4, 2))
+    optim = optimizer.make(torch.optim.SGD, model, lr, wd)
+    return model, optim
+
+
+def test_decoupled_weight_decay():
+    model, optim = make_sgd(1/10, 1/2)
+    before = [p.detach().clone() for p in model.parameters()]
+    for p in model.parameters():
+        p.grad = torch.zeros_like(p)
+
+    optim.step()
+    for old, new in zip(before, model.parameters()):
+        assert torch.allclose(new, old * (1 - 1/20))
+
+
+def test_weight_decay_skips_params_without_grads():
+    model, optim = make_sgd(1/10, 1/2)
+    before = [p.detach().clone() for p in model.parameters()]
+    first = model[0].weight
+    first.grad = torch.zeros_like(first)
+
+    optim.step()
+    assert torch.allclose(first, before[0] * (1 - 1/20))
+    for old, new in zip(before[1:], list(model.parameters())[1:]):
+        assert torch.equal(new, old)
+
+
+def test_weight_decay_fallback(monkeypatch):
+    monkeypatch.setattr(torch_util, 'HAS_FOREACH_MUL', False)
+    test_decoupled_weight_decay()
+
+
+def test_zero_grad_fallback(monkeypatch):
+    monkeypatch.setattr(torch_util, 'HAS_FOREACH_ZERO', False)
+    test_zero_mode_foreach_keeps_grads()
+
+
+def train_sgd(flat=False, n_steps=3, zero_mode='default'):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.Linear(4, 2))
+    optim = optimizer.make(
+        lambda groups: torch.optim.SGD(groups, lr=0, momentum=0.9),
+        [model[0], model[1]], [1/10, 1/20], 1/2, flat=flat, zero_mode=zero_mode)
+    gen = torch.Generator().manual_seed(1)
+    for _ in range(n_steps):
+        optim.zero_grad()
+        x, y = torch.randn(5, 3, generator=gen), torch.randn(5, 2, generator=gen)
+        torch.nn.functional.mse_loss(model(x), y).backward()
+        optim.step()
+    return model, optim
+
+
+def test_flat_params_are_views():
+    model, optim = train_sgd(flat=True, n_steps=0)
+    assert len(optim.param_groups) == 2
+    for group, layer in zip(optim.param_groups, model):
+        assert group['flat']
+        flat, = group['params']
+        assert flat.numel() == sum(p.numel() for p in layer.parameters())
+        for p in layer.parameters():
+            assert p.data_ptr() >= flat.data_ptr()
+            assert p.grad.data_ptr() >= flat.grad.data_ptr()
+
+    with torch.no_grad():
+        optim.param_groups[0]['params'][0].fill_(1)
+    assert torch.equal(model[0].weight, torch.ones(4, 3))
+
+
+def test_flat_matches_unflat():
+    flat_model, flat_optim = train_sgd(flat=True)
+    model, optim = train_sgd(flat=False)
+    for flat_p, p in zip(flat_model.parameters(), model.parameters()):
+        assert torch.allclose(flat_p, p)
+        assert torch.allclose(flat_p.grad, p.grad)
+    assert flat_optim.optim.state_dict()['state'].keys() == {0, 1}
+
+
+def test_flat_zero_grad_in_place():
+    model, optim = train_sgd(flat=True, n_steps=1)
+    grad = model[1].bias.grad
+    optim.zero_grad()
+    assert model[1].bias.grad is grad
+    assert not optim.param_groups[1]['params'][0].grad.any()
+
+
+@pytest.mark.parametrize('flat', [False, True])
+def test_weight_decay_skips_unused_params(flat):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.Linear(4, 2))
+    optim = optimizer.make(torch.optim.SGD, model, 1/10, 1/2, flat=flat)
+    unused = model[1].weight.detach().clone()
+    for _ in range(2):
+        optim.zero_grad()
+        model[0](torch.ones(5, 3)).sum().backward()
+        optim.step()
+    assert torch.equal(model[1].weight, unused)
+
+
+@pytest.mark.parametrize('breaks', [
+    lambda model: model.zero_grad(set_to_none=True),
+    lambda model: setattr(model[0].weight, 'data', model[0].weight.data.clone()),
+])
+def test_flat_views_are_checked(breaks):
+    model, optim = train_sgd(flat=True, n_steps=1)
+    breaks(model)
+    with pytest.raises(RuntimeError):
+        optim.step()
+
+
+def test_flat_needs_one_dtype():
+    model = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.Linear(4, 2).double())
+    with pytest.raises(ValueError):
+        optimizer.make(torch.optim.SGD, model, 1/10, flat=True)
+
+
+@pytest.mark.parametrize('flat', [False, True])
+@pytest.mark.parametrize('zero_mode', ['default', 'none', 'foreach'])
+def test_zero_modes_match(zero_mode, flat):
+    model, _ = train_sgd(flat, n_steps=2, zero_mode=zero_mode)
+    reference, _ = train_sgd(n_steps=2)
+    for p, expected in zip(model.parameters(), reference.parameters()):
+        assert torch.allclose(p, expected)
+
+
+def test_zero_mode_none_frees_grads():
+    model, optim = make_sgd(1/10, 1/2)
+    optim.zero_mode = 'none'
+    for p in model.parameters():
+        p.grad = torch.ones_like(p)
+    optim.zero_grad()
+    assert all(p.grad is None for p in model.parameters())
+
+    before = [p.detach().clone() for p in model.parameters()]
+    optim.step()
+    for old, new in zip(before, model.parameters()):
+        assert torch.equal(new, old)
+
+
+def test_zero_mode_foreach_keeps_grads():
+    model, optim = make_sgd(1/10, 1/2)
+    optim.zero_mode = 'foreach'
+    grads = []
+    for p in model.parameters():
+        p.grad = torch.ones_like(p)
+        grads.append(p.grad)
+    optim.zero_grad()
+    for p, grad in zip(model.parameters(), grads):
+        assert p.grad is grad
+        assert not grad.any()
+
+
+@pytest.mark.parametrize('zero_mode', ['default', 'none', 'foreach'])
+def test_zero_modes_keep_flat_views(zero_mode):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.Linear(4, 2))
+    optim = optimizer.make(torch.optim.SGD, model, 1/10, flat=True, zero_mode=zero_mode)
+    grad = model[0].weight.grad
+    grad.fill_(1)
+    optim.zero_grad()
+    assert model[0].weight.grad is grad
+    assert not grad.any()
+
+
+def test_bad_zero_mode():
+    with pytest.raises(ValueError):
+        optimizer.ProgrammableOptimizer(MockOptimizer(1), zero_mode='sometimes')
@@ -1,6 +1,7 @@
 import pytest
 
 import collections
+import numpy as np
 
 from kerosene import optimizer, sched, shape
 
@@ -126,3 +127,51 @@ def test_step_past_finish_fails():
         schedule.step()
     with pytest.raises(ValueError):
         schedule.step()
+
+
+def test_compiled_matches_uncompiled():
+    def run(compiled):
+        optim = optimizer.ProgrammableOptimizer(MockOptimizer(3))
+        optim.set_lrs([1, 2, 4])
+        optim.set_momentums(0.95)
+        schedule = sched.one_cycle(optim, 10, wds=(1e-2, 1e-3), compiled=compiled)
+        schedule.init_training()
+        values = [(list(optim.get_lrs()), list(optim.get_momentums()))]
+        for _ in range(10):
+            schedule.step()
+            values.append((list(optim.get_lrs()), list(optim.get_momentums())))
+        return values, list(optim.get_param('wd'))
+
+    expected_values, expected_wds = run(compiled=False)
+    values, wds = run(compiled=True)
+    for (lrs, moms), (expected_lrs, expected_moms) in zip(values, expected_values):
+        assert lrs == pytest.approx(expected_lrs)
+        assert moms == pytest.approx(expected_moms)
+    assert wds == pytest.approx(expected_wds)
+
+
+def test_compiled_tables():
+    optim = optimizer.ProgrammableOptimizer(MockOptimizer(2))
+    optim.set_lrs([1, 2])
+    schedule = sched.clr(optim, 4, lr_factor=2, compiled=True)
+    schedule.init_training()
+
+    table = schedule.tables['lr']
+    assert table.dtype == np.float32
+    assert table.shape == (5, 2)
+    assert list(table[:, 1]) == [1, 3/2, 2, 3/2, 1]
+
+
+def test_compiled_unsupported_parameter():
+    optim = optimizer.ProgrammableOptimizer(MockOptimizer(2))
+    optim.set_lrs([1, 2])
+    with pytest.raises(NotImplementedError):
+        schedule = sched.Schedule(optim, 4, {'rando': shape.line(1/4, 3/4)}, compiled=True)
+        schedule.init_training()
+
+
+def test_compiled_nop_is_fine():
+    schedule = sched.Schedule(None, 0, {}, compiled=True)
+    schedule.init_training()
+    for _ in range(4):
+        schedule.step()
@@ -1,5 +1,7 @@
 import pytest
 
+import numpy as np
+
 from kerosene import shape
 
 
@@ -56,6 +58,17 @@ def test_line():
     assert line.range() == (1, 3)
 
 
+def test_exp():
+    exp = shape.exp(1e-2, 1e2)
+    assert exp(0) == pytest.approx(1e-2)
+    assert exp(1/2) == pytest.approx(1)
+    assert exp(1) == pytest.approx(1e2)
+    assert exp.range() == pytest.approx((1e-2, 1e2))
+
+    with pytest.raises(ValueError):
+        shape.exp(0, 1)
+
+
 def test_clr():
     clr = shape.clr()
     assert clr(0) == pytest.approx(1/10)
@@ -105,3 +118,48 @@ def test_one_cycle_momentum():
     lo, hi = momentum.range()
     assert lo == pytest.approx(0.85)
     assert hi == pytest.approx(0.95)
+
+
+@pytest.mark.parametrize('shape_fn', [
+    shape.ConstantShape(),
+    shape.LineShape(),
+    shape.const(3),
+    shape.line(1, 3),
+    shape.exp(1e-3, 10),
+    shape.clr(),
+    shape.stlr(20),
+    shape.burn_in(10),
+    shape.one_cycle(),
+    shape.one_cycle_momentum(0.95, 0.85),
+])
+def test_evaluate_matches_call(shape_fn):
+    xs = np.linspace(0, 1, 41)
+    ys = shape_fn.evaluate(xs)
+    assert ys.shape == xs.shape
+    assert list(ys) == pytest.approx([shape_fn(x) for x in xs])
+
+
+def test_evaluate_keeps_shape():
+    xs = np.linspace(0, 1, 12).reshape(3, 4)
+    ys = shape.clr().evaluate(xs)
+    assert ys.shape == (3, 4)
+    assert ys[0, 0] == pytest.approx(1/10)
+
+
+def test_evaluate_out_of_range():
+    with pytest.raises(ValueError):
+        shape.clr().evaluate([0, 1/2, 2])
+
+    with pytest.raises(ValueError):
+        shape.clr().evaluate([-1/2, 1/2])
+
+
+def test_evaluate_fallback_for_custom_shapes():
+    class Square(shape.Shape):
+        def compute(self, x):
+            return x*x
+
+        def range(self):
+            return (0, 1)
+
+    assert list(Square().evaluate([0, 1/2, 1])) == [0, 1/4, 1]
@@ -0,0 +1,74 @@
+import math
+
+import pytest
+import torch
+
+from kerosene import sweep
+
+
+def test_grid():
+    configs = sweep.grid(lr=[0.1, 0.01], lr_factor=[10], momentums=[(0.95, 0.85)])
+    assert configs == [
+        {'lr': 0.1, 'lr_factor': 10, 'momentums': (0.95, 0.85)},
+        {'lr': 0.01, 'lr_factor': 10, 'momentums': (0.95, 0.85)},
+    ]
+
+
+def test_sample():
+    configs = sweep.sample(
+        20, seed=0, lr=sweep.log_uniform(1e-4, 1), schedule=['stlr', 'clr'],
+        up_share=sweep.uniform(0.1, 0.3), lr_factor=10)
+    assert len(configs) == 20
+    assert configs == sweep.sample(
+        20, seed=0, lr=sweep.log_uniform(1e-4, 1), schedule=['stlr', 'clr'],
+        up_share=sweep.uniform(0.1, 0.3), lr_factor=10)
+    assert all(1e-4 <= config['lr'] <= 1 for config in configs)
+    assert all(0.1 <= config['up_share'] <= 0.3 for config in configs)
+    assert {config['schedule'] for config in configs} == {'stlr', 'clr'}
+    assert all(config['lr_factor'] == 10 for config in configs)
+
+
+def test_budgets():
+    assert sweep._budgets(9, None, 1) == [9]
+    assert sweep._budgets(9, 3, 1) == [1, 3, 9]
+    assert sweep._budgets(10, 3, 1) == [1, 3, 9, 10]
+    assert sweep._budgets(4, 2, 4) == [4]
+    with pytest.raises(ValueError):
+        sweep._budgets(4, 1, 1)
+    with pytest.raises(ValueError):
+        sweep._budgets(4, 2, 5)
+
+
+def test_run_in_process(capsys, make_model, make_dl):
+    configs = sweep.grid(lr=[0.1, 1e-5], schedule=['one_cycle', 'clr'])
+    results = sweep.run(
+        make_model, torch.optim.SGD, torch.nn.functional.mse_loss,
+        make_dl(16), make_dl(2, seed=1), configs, 1, n_procs=0)
+    assert len(results) == 4
+    assert [row['lr'] for row in results[:2]] == [0.1, 0.1]
+    assert results[0]['val_loss'] <= results[-1]['val_loss']
+
+    sweep.show(results)
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 5
+    assert lines[0].split() == ['trial', 'rung', 'epochs', 'lr', 'schedule', 'val_loss']
+
+
+def test_run_successive_halving(make_model, make_dl):
+    configs = sweep.grid(lr=[0.1, 0.03, 1e-4, 1e-5])
+    results = sweep.run(
+        make_model, torch.optim.SGD, torch.nn.functional.mse_loss,
+        make_dl(16), make_dl(2, seed=1), configs, 4, n_procs=0, eta=2)
+    assert [row['rung'] for row in results] == [2, 1, 1, 0, 0, 0, 0]
+    assert [row['epochs'] for row in results] == [4, 2, 2, 1, 1, 1, 1]
+    assert results[0]['lr'] in (0.1, 0.03)
+    assert not any(math.isnan(row['val_loss']) for row in results)
+
+
+def test_run_in_pool(make_model, make_dl):
+    configs = sweep.grid(lr=[0.1, 1e-5])
+    results = sweep.run(
+        make_model, torch.optim.SGD, torch.nn.functional.mse_loss,
+        make_dl(16), make_dl(2, seed=1), configs, 1, n_procs=2)
+    assert sorted(row['trial'] for row in results) == [0, 1]
+    assert results[0]['lr'] == 0.1
@@ -0,0 +1,77 @@
+import json
+import time
+
+from kerosene import timing
+
+
+def test_phases():
+    timer = timing.PhaseTimer()
+    for _ in range(3):
+        with timer.phase('forward'):
+            time.sleep(1e-3)
+    with timer.phase('backward'):
+        pass
+
+    summary = timer.summary()
+    assert list(summary) == ['forward', 'backward']
+    assert summary['forward']['count'] == 3
+    assert summary['forward']['secs'] >= 3e-3
+    assert sum(summary['forward']['histogram'].values()) == 3
+    assert min(summary['forward']['histogram']) >= 10
+    assert timer.breakdown().startswith('forward:')
+
+
+def test_phase_records_errors():
+    timer = timing.PhaseTimer()
+    try:
+        with timer.phase('forward'):
+            raise KeyError()
+    except KeyError:
+        pass
+    assert timer.counts['forward'] == 1
+
+
+def test_iterate():
+    timer = timing.PhaseTimer()
+    assert list(timer.iterate(range(4), 'data')) == [0, 1, 2, 3]
+    assert timer.counts['data'] == 4
+
+
+def test_end_epoch():
+    timer = timing.PhaseTimer()
+    with timer.phase('forward'):
+        pass
+    summary = timer.end_epoch()
+    assert summary['forward']['count'] == 1
+    assert timer.history == [summary]
+    assert timer.summary() == {}
+
+
+def test_export_trace(tmp_path):
+    timer = timing.PhaseTimer(trace=True)
+    with timer.phase('forward'):
+        pass
+    with timer.phase('backward'):
+        pass
+
+    path = tmp_path / 'trace.json'
+    timer.export_trace(path)
+    events = json.loads(path.read_text())['traceEvents']
+    assert [e['name'] for e in events] == ['forward', 'backward']
+    assert events[0]['ts'] <= events[1]['ts']
+
+
+def test_profiled_phases():
+    timer = timing.PhaseTimer(profile=True)
+    with timer.phase('forward'):
+        pass
+    assert timer.counts['forward'] == 1
+
+
+def test_no_timer():
+    timer = timing.NO_TIMER
+    with timer.phase('forward'):
+        pass
+    items = [1, 2]
+    assert timer.iterate(items, 'data') is items
+    assert timer.breakdown() is None
@@ -0,0 +1,97 @@
+import pytest
+
+import array
+import numpy as np
+import torch
+
+from kerosene import torch_util
+
+
+def test_create_tensor_shares_memory():
+    x = np.arange(6, dtype=np.int64).reshape(2, 3)
+    t = torch_util.create_tensor(x)
+    assert t.dtype == torch.int64
+    x[0, 0] = 7
+    assert t[0, 0] == 7
+
+    x = np.ones(4, dtype=np.float32)
+    t = torch_util.create_tensor(x)
+    assert t.dtype == torch.float32
+    assert t.data_ptr() == x.ctypes.data
+
+
+def test_create_tensor_casts():
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        assert torch_util.create_tensor(np.arange(3, dtype=dtype)).dtype == torch.int64
+    assert torch_util.create_tensor(np.ones(3)).dtype == torch.float32
+
+
+@pytest.mark.parametrize('dtype, expected', [
+    (np.bool_, torch.bool),
+    (np.uint8, torch.uint8),
+    (np.int32, torch.int32),
+    (np.float16, torch.float16),
+    (np.float64, torch.float64),
+])
+def test_create_tensor_preserves_dtypes(dtype, expected):
+    t = torch_util.create_tensor(np.zeros(3, dtype=dtype), cast=False)
+    assert t.dtype == expected
+
+
+def test_create_tensor_non_contiguous():
+    x = np.arange(12, dtype=np.float32).reshape(3, 4).T
+    t = torch_util.create_tensor(x)
+    assert t.is_contiguous()
+    assert t.tolist() == x.tolist()
+
+
+def test_create_tensor_from_buffers():
+    t = torch_util.create_tensor(memoryview(array.array('i', [1, 2, 3])), cast=False)
+    assert t.dtype == torch.int32
+    assert t.tolist() == [1, 2, 3]
+
+    t = torch_util.create_tensor(memoryview(b'abc'))
+    assert t.dtype == torch.uint8
+    assert t.tolist() == [97, 98, 99]
+
+
+def test_create_tensor_byte_order():
+    x = np.arange(3, dtype='>i4')
+    assert torch_util.create_tensor(x).tolist() == [0, 1, 2]
+
+
+def test_create_tensor_unsupported():
+    with pytest.raises(NotImplementedError):
+        torch_util.create_tensor(np.array(['a', 'b']))
+
+
+def test_tensor_casts_after_copy():
+    assert torch_util.tensor(np.arange(3, dtype=np.int32)).dtype == torch.int64
+    assert torch_util.tensor(np.arange(3, dtype=np.int32), cast=False).dtype == torch.int32
+
+    existing = torch.arange(3, dtype=torch.int32)
+    assert torch_util.tensor(existing) is existing
+
+
+def test_variable_lists():
+    xs = torch_util.variable([np.arange(3, dtype=np.int16), np.zeros(2)])
+    assert [x.dtype for x in xs] == [torch.int64, torch.float32]
+
+
+def test_materialize():
+    assert torch_util.materialize(torch.tensor(1.5)) == 1.5
+    assert type(torch_util.materialize(torch.tensor(2))) is int
+    assert torch_util.materialize(3) == 3
+
+
+def test_variable_batch():
+    xs, y = torch_util.variable_batch((np.zeros((4, 3)), np.zeros((4, 2)), np.ones(4)))
+    assert [x.shape for x in xs] == [(4, 3), (4, 2)]
+    assert y.shape == (4,)
+    assert [x.shape for x in torch_util.variable_inputs(np.zeros((4, 3)))] == [(4, 3)]
+
+
+def test_batch_size():
+    x = torch.zeros(5, 4)
+    assert torch_util.batch_size([x]) == 5
+    assert torch_util.batch_size(x, seq_first=True) == 4
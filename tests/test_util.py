@@ -44,3 +44,32 @@ def test_list_along_failures():
 
     with pytest.raises(ValueError):
         util.list_along((3, 4, 5), 5)
+
+
+def test_prefetch():
+    assert list(util.prefetch(range(10), 1)) == list(range(10))
+    assert list(util.prefetch(iter([]), 3)) == []
+    assert list(util.prefetch((i*i for i in range(100)), 4)) == [i*i for i in range(100)]
+
+
+@pytest.mark.parametrize('error', [KeyError, KeyboardInterrupt, SystemExit])
+def test_prefetch_propagates_errors(error):
+    def failing():
+        yield 1
+        raise error('boom')
+
+    items = util.prefetch(failing(), 2)
+    assert next(items) == 1
+    with pytest.raises(error):
+        next(items)
+
+
+def test_prefetch_stops_early():
+    items = util.prefetch(itertools.count(), 2)
+    assert next(items) == 0
+    items.close()
+
+
+def test_bad_prefetch_size():
+    with pytest.raises(ValueError):
+        list(util.prefetch(range(3), 0))